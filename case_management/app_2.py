@@ -8,15 +8,18 @@ import uuid
 import logging
 import math
 import base64
+from case_counters import CaseConflict, insert_case, read_count, total_sort_key, write_case
+from perf import InstrumentedTable, instrumented_handler, note_query, phase
 
 
 dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE'])
+table = InstrumentedTable(dynamodb.Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE']))
 
 # -------- structured logging -------- #
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@instrumented_handler('CaseManagement')
 def lambda_handler(event, context):
     http_method = event['httpMethod']
     resource = event['resource']
@@ -77,9 +80,13 @@ def create_case(event, context):
             'created_at': datetime.now().isoformat()
         }
         
-        table.put_item(Item=item)
+        # The open-case counters move in the same transaction
+        if not insert_case(table, item):
+            return response(409, {'message': 'Case already exists'})
         
         return response(200, {'message': 'Case created successfully', 'case_id': transaction_id})
+    except CaseConflict:
+        return response(409, {'message': 'Case was modified concurrently, please retry'})
     except Exception as e:
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
@@ -244,6 +251,69 @@ def parse_pagination_token(token):
         return None, None
 
 
+# Filtered listings query until the page is full; Limit grows with the
+# observed share of items kept, up to FILL_MAX_LIMIT, for at most
+# FILL_MAX_QUERIES queries per page
+FILL_GROWTH = 4
+FILL_MAX_LIMIT = 1000
+FILL_MAX_QUERIES = 25
+
+
+def fill_page(key_condition, keep, per_page, exclusive_start_key=None):
+    """
+    Query newest-first until *per_page* items pass *keep* or the partition
+    ends.  Returns `(items, ExclusiveStartKey of the next page or None)`.
+
+    The cursor is the key of the last item returned when the page filled up
+    mid-query, so the items after it are neither skipped nor repeated, and
+    None when nothing after it passes *keep*.  Each query reads one item
+    more than needed so a full last page is usually known to be the last.
+    """
+    items = []
+    scanned = 0
+    limit = per_page + 1
+    for _ in range(FILL_MAX_QUERIES):
+        query_params = {
+            "KeyConditionExpression": key_condition,
+            "Limit": limit,
+            "ScanIndexForward": False,
+        }
+        if exclusive_start_key:
+            query_params["ExclusiveStartKey"] = exclusive_start_key
+        result = table.query(**query_params)
+        page = result.get("Items", [])
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        scanned += len(page)
+
+        for index, item in enumerate(page):
+            if not keep(item):
+                continue
+            items.append(item)
+            if len(items) < per_page:
+                continue
+            rest = page[index + 1:]
+            if not rest:
+                return items, last_evaluated_key
+            if not last_evaluated_key and not any(keep(later) for later in rest):
+                return items, None
+            return items, {"PARTITION_KEY": item["PARTITION_KEY"], "SORT_KEY": item["SORT_KEY"]}
+
+        if not last_evaluated_key:
+            return items, None
+        exclusive_start_key = last_evaluated_key
+
+        # Size the next query for the rows still needed at the rate seen so far
+        needed = per_page - len(items)
+        if items:
+            limit = math.ceil(needed * scanned / len(items))
+        else:
+            limit *= FILL_GROWTH
+        limit = max(needed, min(limit, FILL_MAX_LIMIT)) + 1
+
+    # Query budget spent: a short page, resumable from where it stopped
+    return items, exclusive_start_key
+
+
 def format_paginated_response(
     items, current_page, per_page, next_pagination_token=None, total_records=None
 ):
@@ -353,14 +423,26 @@ def update_case_status(event, context):
         if not transaction_id or not new_status:
             return response(400, {'message': 'transaction_id and status are required'})
         
-        table.update_item(
-            Key={'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id},
-            UpdateExpression='SET #status = :status, updated_at = :updated_at',
-            ExpressionAttributeNames={'#status': 'status'},
-            ExpressionAttributeValues={':status': new_status, ':updated_at': datetime.now().isoformat()}
-        )
+        updated_at = datetime.now().isoformat()
+
+        def change(case):
+            operation = {
+                'Update': {
+                    'TableName': table.name,
+                    'Key': {'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id},
+                    'UpdateExpression': 'SET #status = :status, updated_at = :updated_at',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': {':status': new_status, ':updated_at': updated_at},
+                }
+            }
+            return [operation], dict(case, status=new_status, updated_at=updated_at)
+
+        if write_case(table, transaction_id, change) is None:
+            return response(404, {'message': 'Case not found'})
         
         return response(200, {'message': 'Case status updated successfully'})
+    except CaseConflict:
+        return response(409, {'message': 'Case was modified concurrently, please retry'})
     except Exception as e:
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
@@ -387,6 +469,21 @@ def get_case(event, context):
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
 
+def count_open_cases(status, assigned_to):
+    """COUNT query over the open cases with both *status* and *assigned_to*"""
+    query_kwargs = {
+        "KeyConditionExpression": Key("PARTITION_KEY").eq("CASE"),
+        "Select": "COUNT",
+        "FilterExpression": Attr("report").not_exists() & Attr("status").eq(status) & Attr("assigned_to").eq(assigned_to),
+    }
+    total = 0
+    while True:
+        result = table.query(**query_kwargs)
+        total += result.get("Count", 0)
+        if "LastEvaluatedKey" not in result:
+            return total
+        query_kwargs["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
 def get_open_cases(event, context):
     """
     Paginated retrieval of open cases.
@@ -394,6 +491,7 @@ def get_open_cases(event, context):
     Query params:
       - transaction_id    (optional)
       - status            (optional)
+      - assigned_to       (optional)
       - page              (optional, default 1)
       - per_page          (optional, default 20)
       - pagination_token  (optional) – opaque token from previous call
@@ -402,6 +500,7 @@ def get_open_cases(event, context):
         query_params = event.get("queryStringParameters", {}) or {}
         transaction_id = query_params.get("transaction_id")
         status = query_params.get("status")
+        assigned_to = query_params.get("assigned_to")
 
         per_page = int(query_params.get("per_page", 20))
         pagination_token = query_params.get("pagination_token")
@@ -412,49 +511,39 @@ def get_open_cases(event, context):
             current_page = token_meta.get("page", current_page)
 
         # Build key condition
+        note_query(partitions=["CASE"])
         key_condition = Key("PARTITION_KEY").eq("CASE")
         if transaction_id:
             key_condition = key_condition & Key("SORT_KEY").eq(transaction_id)
 
-        dynamo_query_params = {
-            "KeyConditionExpression": key_condition,
-            "Limit": per_page,
-            "ScanIndexForward": False,
-        }
-
-        if exclusive_start_key:
-            dynamo_query_params["ExclusiveStartKey"] = exclusive_start_key
-
-        result = table.query(**dynamo_query_params)
-
-        items = result.get("Items", [])
-        filtered_items = []
-
         # Post-query filtering
-        for item in items:
+        def keep(item):
             if "report" in item:
-                continue
+                return False
             if not item.get("assigned_to"):
-                continue
+                return False
             if status and item.get("status") != status:
-                continue
-            filtered_items.append(item)
+                return False
+            if assigned_to and item.get("assigned_to") != assigned_to:
+                return False
+            return True
 
-        # -------- total count query -------- #
-        count_filter = Attr("assigned_to").exists() & Attr("report").not_exists()
-        if status:
-            count_filter = count_filter & Attr("status").eq(status)
+        filtered_items, last_evaluated_key = fill_page(key_condition, keep, per_page, exclusive_start_key)
+        note_query(rows=len(filtered_items))
 
-        count_query_params = {
-            "KeyConditionExpression": key_condition,
-            "Select": "COUNT",
-            "FilterExpression": count_filter,
-        }
-        count_result = table.query(**count_query_params)
-        total_records = count_result.get("Count", 0)
-        # ----------------------------------- #
+        # -------- total from the maintained counters -------- #
+        total_records = None
+        counter_key = total_sort_key(status, assigned_to)
+        if transaction_id:
+            # At most one case matches the key condition
+            total_records = len(filtered_items)
+        elif counter_key:
+            total_records = read_count(table, counter_key)
+        else:
+            # status + assigned_to has no counter: count the partition
+            total_records = count_open_cases(status, assigned_to)
+        # ---------------------------------------------------- #
 
-        last_evaluated_key = result.get("LastEvaluatedKey")
         next_token = create_pagination_token(last_evaluated_key, current_page) if last_evaluated_key else None
 
         formatted = format_paginated_response(
@@ -494,31 +583,21 @@ def get_closed_cases(event, context):
         if token_meta:
             current_page = token_meta.get("page", current_page)
 
+        note_query(partitions=["CLOSED_CASE"])
         key_condition = Key("PARTITION_KEY").eq("CLOSED_CASE")
         if transaction_id:
             key_condition = key_condition & Key("SORT_KEY").eq(transaction_id)
 
-        dynamo_query_params = {
-            "KeyConditionExpression": key_condition,
-            "Limit": per_page,
-            "ScanIndexForward": False,
-        }
-
-        if exclusive_start_key:
-            dynamo_query_params["ExclusiveStartKey"] = exclusive_start_key
-
-        result = table.query(**dynamo_query_params)
-
-        items = result.get("Items", [])
-        filtered_items = []
-        for item in items:
+        def keep(item):
             if not item.get("assigned_to"):
-                continue
+                return False
             if status and item.get("status") != status:
-                continue
-            filtered_items.append(item)
+                return False
+            return True
+
+        filtered_items, last_evaluated_key = fill_page(key_condition, keep, per_page, exclusive_start_key)
+        note_query(rows=len(filtered_items))
 
-        last_evaluated_key = result.get("LastEvaluatedKey")
         next_token = create_pagination_token(last_evaluated_key, current_page) if last_evaluated_key else None
 
         formatted = format_paginated_response(
@@ -541,30 +620,30 @@ def close_case(event, context):
         if not transaction_id:
             return response(400, {'message': 'transaction_id is required'})
         
-        # Get the existing case
-        result = table.get_item(Key={'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id})
-        
-        if 'Item' not in result:
+        closed_at = datetime.now().isoformat()
+
+        def change(case):
+            # Delete the existing case and create a new closed case atomically
+            closed_case = {
+                'PARTITION_KEY': 'CLOSED_CASE',
+                'SORT_KEY': transaction_id,
+                'status': case.get('status'),#'CLOSED',
+                'assigned_to': case.get('assigned_to'),
+                'created_at': case.get('created_at'),
+                'closed_at': closed_at
+            }
+            operations = [
+                {'Delete': {'TableName': table.name, 'Key': {'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id}}},
+                {'Put': {'TableName': table.name, 'Item': closed_case}},
+            ]
+            return operations, None
+
+        if write_case(table, transaction_id, change) is None:
             return response(404, {'message': 'Case not found'})
         
-        case = result['Item']
-        
-        # Delete the existing case
-        table.delete_item(Key={'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id})
-        
-        # Create a new closed case
-        closed_case = {
-            'PARTITION_KEY': 'CLOSED_CASE',
-            'SORT_KEY': transaction_id,
-            'status': case.get('status'),#'CLOSED',
-            'assigned_to': case.get('assigned_to'),
-            'created_at': case.get('created_at'),
-            'closed_at': datetime.now().isoformat()
-        }
-        
-        table.put_item(Item=closed_case)
-        
         return response(200, {'message': 'Case closed successfully'})
+    except CaseConflict:
+        return response(409, {'message': 'Case was modified concurrently, please retry'})
     except Exception as e:
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
@@ -746,9 +825,11 @@ def response(status_code, body):
         "data": data_field,
         "metadata": metadata_field,
     }
+    with phase('serialize'):
+        body_json = json.dumps(body_to_send, default=decimal_default)
     return {
         'statusCode': status_code,
-        'body': json.dumps(body_to_send, default=decimal_default),
+        'body': body_json,
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
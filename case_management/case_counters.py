@@ -0,0 +1,283 @@
+"""
+Maintained counters of the open cases listed by `GET /cases/open`.
+
+A case in the `CASE` partition is listed when it has an `assigned_to` and is
+not a legacy report item.  Every listed case is counted in
+
+    PARTITION_KEY = "CASE_COUNTER"
+    SORT_KEY      = "OPEN#TOTAL"
+                    "OPEN#STATUS#<status>"               (cases with a status)
+                    "OPEN#INVESTIGATOR#<assigned_to>"
+    count         = number of listed open cases
+
+`create_case`, `update_case_status` and `close_case` write the case and ADD
+the counter deltas in one transaction, conditional on the case still holding
+the `status` / `assigned_to` it was read with, so `total_records` is a single
+GetItem instead of a COUNT query over the whole partition.
+
+Counters drift only through writes made outside those handlers.
+`CaseCounterReconcileFunction` (`reconcile()`) recounts the partition and
+corrects the counters that differ; each correction is conditional on the
+counter not having moved during the recount, and a counter that did is left
+for the next run.  Run it once after deploying to create the counters.
+"""
+import os
+from collections import Counter
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+COUNTER_PARTITION_KEY = "CASE_COUNTER"
+TOTAL_SORT_KEY = "OPEN#TOTAL"
+
+# Reads and conditional writes of one case before giving up on a busy case
+CASE_WRITE_ATTEMPTS = 3
+
+# Attributes the counters depend on; a case write is conditional on them
+COUNTED_ATTRIBUTES = ('status', 'assigned_to')
+
+
+class CaseConflict(Exception):
+    """The case kept changing between reading and writing it"""
+
+
+def cancellation_codes(error):
+    """Per-operation reason codes of a cancelled transaction; None for any other error"""
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return None
+    return [reason.get('Code') for reason in error.response.get('CancellationReasons') or []]
+
+
+def status_sort_key(status):
+    return f"OPEN#STATUS#{status}"
+
+
+def investigator_sort_key(assigned_to):
+    return f"OPEN#INVESTIGATOR#{assigned_to}"
+
+
+def is_listed(case):
+    """Whether `GET /cases/open` lists (and the counters count) *case*"""
+    return bool(case) and 'report' not in case and bool(case.get('assigned_to'))
+
+
+def counter_keys(case):
+    """Counter sort keys *case* contributes one to"""
+    if not is_listed(case):
+        return []
+    keys = [TOTAL_SORT_KEY, investigator_sort_key(case['assigned_to'])]
+    if case.get('status'):
+        keys.append(status_sort_key(case['status']))
+    return keys
+
+
+def counter_deltas(old_case, new_case):
+    """`{counter sort key: delta}` for replacing *old_case* by *new_case*"""
+    deltas = Counter(counter_keys(new_case))
+    deltas.subtract(counter_keys(old_case))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def total_sort_key(status=None, assigned_to=None):
+    """The counter holding the open-case total for a filter; None if there is none"""
+    if status and assigned_to:
+        return None
+    if status:
+        return status_sort_key(status)
+    if assigned_to:
+        return investigator_sort_key(assigned_to)
+    return TOTAL_SORT_KEY
+
+
+def read_count(table, sort_key):
+    item = table.get_item(
+        Key={'PARTITION_KEY': COUNTER_PARTITION_KEY, 'SORT_KEY': sort_key}
+    ).get('Item')
+    return int(item['count']) if item else 0
+
+
+def unchanged_condition(case):
+    """
+    Condition arguments matching only while the case still exists with the
+    counted attributes of *case*
+    """
+    clauses = ['attribute_exists(SORT_KEY)']
+    names = {}
+    values = {}
+    for attribute in COUNTED_ATTRIBUTES:
+        name = f"#counted_{attribute}"
+        names[name] = attribute
+        if case.get(attribute) is None:
+            # Stored as NULL by create_case, or never written
+            clauses.append(f"(attribute_not_exists({name}) OR attribute_type({name}, :counted_null))")
+            values[':counted_null'] = 'NULL'
+        else:
+            clauses.append(f"{name} = :counted_{attribute}")
+            values[f":counted_{attribute}"] = case[attribute]
+    return {
+        'ConditionExpression': ' AND '.join(clauses),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+    }
+
+
+def with_condition(operation, condition):
+    """Merge `unchanged_condition()` arguments into a transact operation body"""
+    merged = dict(operation, ConditionExpression=condition['ConditionExpression'])
+    for argument in ('ExpressionAttributeNames', 'ExpressionAttributeValues'):
+        merged[argument] = {**operation.get(argument, {}), **condition[argument]}
+    return merged
+
+
+def transact_case(table, operations, old_case, new_case):
+    """
+    Apply the case *operations* (`TransactItems` entries) together with the
+    counter ADDs for replacing *old_case* by *new_case*
+    """
+    items = list(operations)
+    for sort_key, delta in counter_deltas(old_case, new_case).items():
+        items.append({
+            'Update': {
+                'TableName': table.name,
+                'Key': {'PARTITION_KEY': COUNTER_PARTITION_KEY, 'SORT_KEY': sort_key},
+                'UpdateExpression': 'ADD #count :delta',
+                'ExpressionAttributeNames': {'#count': 'count'},
+                'ExpressionAttributeValues': {':delta': delta},
+            }
+        })
+    # The resource's client takes plain Python values, like Table calls do
+    table.meta.client.transact_write_items(TransactItems=items)
+
+
+def insert_case(table, item):
+    """
+    Create the open case *item* with its counters.  Returns False when the
+    case already exists; transaction conflicts are retried.
+    """
+    operation = {
+        'Put': {
+            'TableName': table.name,
+            'Item': item,
+            'ConditionExpression': 'attribute_not_exists(SORT_KEY)',
+        }
+    }
+    for _ in range(CASE_WRITE_ATTEMPTS):
+        try:
+            transact_case(table, [operation], None, item)
+            return True
+        except ClientError as e:
+            codes = cancellation_codes(e)
+            # The case put is the first operation
+            if codes and codes[0] == 'ConditionalCheckFailed':
+                return False
+            if not codes or 'TransactionConflict' not in codes:
+                raise
+    raise CaseConflict(item['SORT_KEY'])
+
+
+def write_case(table, transaction_id, change):
+    """
+    Read the open case and apply `change(case)`, which returns `(transact
+    operations for the case, the case as it will be or None)`; the counters
+    move in the same transaction.  The operations are made conditional on the
+    case not changing in between, and the read is retried when it did.
+    Returns the case as it was, or None when there is no such open case.
+    """
+    key = {'PARTITION_KEY': 'CASE', 'SORT_KEY': transaction_id}
+    for _ in range(CASE_WRITE_ATTEMPTS):
+        case = table.get_item(Key=key, ConsistentRead=True).get('Item')
+        if case is None:
+            return None
+        operations, new_case = change(case)
+        condition = unchanged_condition(case)
+        operations = [
+            {kind: with_condition(body, condition) if body.get('Key') == key else body}
+            for operation in operations
+            for kind, body in operation.items()
+        ]
+        try:
+            transact_case(table, operations, case, new_case)
+            return case
+        except ClientError as e:
+            # The case changed since it was read, or another transaction held it
+            codes = cancellation_codes(e)
+            if not codes or not {'ConditionalCheckFailed', 'TransactionConflict'} & set(codes):
+                raise
+    raise CaseConflict(transaction_id)
+
+
+def read_counters(table):
+    """`{counter sort key: count}` of every stored counter"""
+    counts = {}
+    query_kwargs = {'KeyConditionExpression': Key('PARTITION_KEY').eq(COUNTER_PARTITION_KEY)}
+    while True:
+        result = table.query(**query_kwargs)
+        for item in result.get('Items', []):
+            counts[item['SORT_KEY']] = int(item.get('count', 0))
+        if 'LastEvaluatedKey' not in result:
+            return counts
+        query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def recount(table):
+    """`{counter sort key: count}` computed from the `CASE` partition"""
+    counts = Counter()
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq('CASE'),
+        'ProjectionExpression': '#status, assigned_to, #report',
+        'ExpressionAttributeNames': {'#status': 'status', '#report': 'report'},
+    }
+    while True:
+        result = table.query(**query_kwargs)
+        for case in result.get('Items', []):
+            counts.update(counter_keys(case))
+        if 'LastEvaluatedKey' not in result:
+            return dict(counts)
+        query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def reconcile(table):
+    """
+    Correct every counter that differs from a recount.  Counters at zero are
+    deleted.  Returns `{"fixed": {key: [stored, counted]}, "skipped": [...]}`;
+    skipped counters changed during the recount.
+    """
+    stored = read_counters(table)
+    counted = recount(table)
+    fixed = {}
+    skipped = []
+    for sort_key in sorted(set(stored) | set(counted)):
+        have = stored.get(sort_key)
+        want = counted.get(sort_key, 0)
+        if (have == want and want != 0) or (have is None and want == 0):
+            continue
+        key = {'PARTITION_KEY': COUNTER_PARTITION_KEY, 'SORT_KEY': sort_key}
+        if have is None:
+            condition = {'ConditionExpression': 'attribute_not_exists(PARTITION_KEY)'}
+        else:
+            condition = {
+                'ConditionExpression': '#count = :stored',
+                'ExpressionAttributeNames': {'#count': 'count'},
+                'ExpressionAttributeValues': {':stored': have},
+            }
+        try:
+            if want == 0:
+                table.delete_item(Key=key, **condition)
+            else:
+                table.put_item(Item=dict(key, count=want), **condition)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            skipped.append(sort_key)
+            continue
+        if have != want:
+            fixed[sort_key] = [have or 0, want]
+    return {'fixed': fixed, 'skipped': skipped}
+
+
+def lambda_handler(event, context):
+    table = boto3.resource('dynamodb').Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE'])
+    result = reconcile(table)
+    print(f"Case counters: fixed {result['fixed']}, skipped {result['skipped']}")
+    return result
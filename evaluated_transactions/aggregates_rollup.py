@@ -0,0 +1,143 @@
+"""
+GET /evaluated-transactions/aggregates
+
+Latest aggregate values for one entity over a time range, without building
+transaction rows.
+
+Every evaluated transaction carries a snapshot of the running aggregates of
+its entity (`AGG-<channel>-<entity>-<SUM|COUNT>-<period>-<bucket>`), each
+with a monotonically increasing `VERSION`.  The newest snapshot of a key is
+the one with the highest `VERSION`, so the rollup streams the entity
+partition, decodes only the `aggregates` field of each blob and keeps one
+value per key.  Time slices are read in parallel and merged with the same
+rule, so memory is bounded by the number of distinct aggregate keys.
+"""
+from query_planner import entity_partition
+from streaming import iter_items, map_ranges, extract_field
+from perf import note_query
+
+# Entity segment label -> response field (same names as `relevant_aggregates`)
+ENTITY_FIELDS = (
+    ('ACCOUNT', 'account_ref'),
+    ('APPLICATION', 'processor'),
+    ('MERCHANT', 'merchant_id'),
+    ('PRODUCT', 'product_id'),
+)
+ENTITY_LABELS = {label for label, _ in ENTITY_FIELDS}
+
+CATEGORIES = (
+    'ACCOUNT',
+    'ACCOUNT_APPLICATION',
+    'ACCOUNT_APPLICATION_MERCHANT',
+    'ACCOUNT_APPLICATION_MERCHANT_PRODUCT',
+)
+PERIODS = ('HOUR', 'DAY', 'WEEK', 'MONTH')
+
+# Bucket components per period, in key order
+BUCKET_FIELDS = {
+    'HOUR': ('year', 'month', 'day', 'hour'),
+    'DAY': ('year', 'month', 'day'),
+    'WEEK': ('year', 'week'),
+    'MONTH': ('year', 'month'),
+}
+
+
+def newer(candidate, current):
+    return current is None or candidate.get('VERSION', 0) > current.get('VERSION', 0)
+
+
+def merge_latest(partials):
+    """Fold `{aggregate_key: value}` maps, keeping the highest VERSION per key"""
+    latest = {}
+    for partial in partials:
+        for key, value in partial.items():
+            if newer(value, latest.get(key)):
+                latest[key] = value
+    return latest
+
+
+def latest_aggregates(partition_key, start_timestamp, end_timestamp):
+    """Worker: `(latest values, transactions read)` for one partition slice"""
+    latest = {}
+    transactions = 0
+    for item in iter_items(partition_key, start_timestamp, end_timestamp):
+        transactions += 1
+        aggregates = extract_field(item['processed_transaction'], 'aggregates', {})
+        for key, value in aggregates.items():
+            if newer(value, latest.get(key)):
+                latest[key] = value
+    return latest, transactions
+
+
+def describe_key(key):
+    """
+    Split an aggregate key into its category and response fields, e.g.
+    `AGG-card-ACCOUNT_A1_APPLICATION_P1-SUM-DAY-2025-07-01`.
+    """
+    _, channel, entity, *rest = key.split('-')
+    # `<metric>-<period>-<bucket...>`; locate the period rather than trust positions
+    split = next((i for i, token in enumerate(rest) if token in PERIODS), len(rest))
+    metric = '-'.join(rest[:split])
+    period = rest[split] if split < len(rest) else ''
+    bucket = rest[split + 1:]
+
+    # Entity ids may themselves contain "_", so split on the level labels
+    ids = {}
+    label = None
+    for token in entity.split('_'):
+        if token in ENTITY_LABELS and (label is None or token not in ids):
+            label = token
+            ids[label] = []
+        elif label is not None:
+            ids[label].append(token)
+
+    levels = [label for label, _ in ENTITY_FIELDS if label in ids]
+    entry = {
+        'channel': channel,
+        'metric': metric,
+        'period': period,
+        'year': '', 'month': '', 'week': '', 'day': '', 'hour': '',
+    }
+    for label, field in ENTITY_FIELDS:
+        entry[field] = '_'.join(ids.get(label, []))
+    entry.update(zip(BUCKET_FIELDS.get(period, ()), bucket))
+    return '_'.join(levels), entry
+
+
+def handle(params, start_timestamp, end_timestamp):
+    """Return `(data, metadata)`; invalid parameters raise ValueError"""
+    partition_key = entity_partition(params)
+    if partition_key is None:
+        raise ValueError('channel and account_ref or processor are required')
+
+    level = params.get('level', '').upper()
+    if level and level not in CATEGORIES:
+        raise ValueError(f"level must be one of {', '.join(CATEGORIES)}")
+    period = params.get('period', '').upper()
+    if period and period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+    partials = map_ranges(latest_aggregates, [partition_key], start_timestamp, end_timestamp)
+    latest = merge_latest(partial for partial, _ in partials)
+    transactions = sum(count for _, count in partials)
+    note_query(partitions=[partition_key])
+
+    data = {}
+    for key, value in latest.items():
+        category, entry = describe_key(key)
+        if (level and category != level) or (period and entry['period'] != period):
+            continue
+        entry.update(COUNT=value.get('COUNT'), SUM=value.get('SUM'), VERSION=value.get('VERSION'))
+        data.setdefault(category, []).append(entry)
+
+    for entries in data.values():
+        entries.sort(key=lambda e: (e['metric'], e['period'], e['year'], e['month'],
+                                    e['week'], e['day'], e['hour']))
+    note_query(rows=sum(len(entries) for entries in data.values()))
+
+    metadata = {
+        'partition': partition_key,
+        'transactions_read': transactions,
+        'aggregate_keys': len(latest),
+    }
+    return data, metadata
@@ -0,0 +1,88 @@
+"""
+GET /evaluated-transactions/amount-quantiles
+
+Amount percentiles per currency over a range of days, answered from the
+per-day t-digests built by `sketch_rollup.py`.  Every (channel, day,
+currency) digest is a fixed-size item, so no transaction is read at query
+time and memory does not grow with the range.
+"""
+from boto3.dynamodb.conditions import Key
+
+from sketches import ALL_CHANNELS, SERIES, TDigest, days_between, sketch_partition_key
+from streaming import csv_param, map_tasks, thread_table
+from perf import note_query
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def read_digests(partition_key, first_day, last_day, currencies):
+    """`{currency: TDigest}` merged over the days stored under *partition_key*"""
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').between(f"{first_day}#", f"{last_day}#~"),
+        'ProjectionExpression': 'SORT_KEY, amount',
+    }
+    digests = {}
+    while True:
+        response = thread_table().query(**query_kwargs)
+        for item in response.get('Items', []):
+            currency = item['SORT_KEY'].split('#', 1)[1]
+            if currencies and currency not in currencies:
+                continue
+            digest = TDigest.from_bytes(item['amount'])
+            if currency in digests:
+                digests[currency].merge(digest)
+            else:
+                digests[currency] = digest
+        if 'LastEvaluatedKey' not in response:
+            return digests
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def quantile_label(q):
+    return 'p' + f"{q * 100:g}".replace('.', '_')
+
+
+def handle(params, start_timestamp, end_timestamp):
+    """Return `(data, metadata)`; invalid parameters raise ValueError"""
+    series = params.get('list_type', 'ALL').upper()
+    if series not in SERIES:
+        raise ValueError(f"Unknown list_type: {series}")
+    # Any channel name; none means the all-channel digests
+    channels = csv_param(params, 'channel', None, (ALL_CHANNELS,))
+    currencies = {c.strip().upper() for c in params.get('currency', '').split(',') if c.strip()}
+    try:
+        quantiles = tuple(float(q) for q in params['q'].split(',')) if params.get('q') else DEFAULT_QUANTILES
+    except ValueError:
+        raise ValueError('q must be a comma-separated list of numbers between 0 and 1')
+    if not all(0 <= q <= 1 for q in quantiles):
+        raise ValueError('q must be a comma-separated list of numbers between 0 and 1')
+
+    days = days_between(start_timestamp, end_timestamp)
+    partition_keys = [sketch_partition_key('TDIGEST', series, channel) for channel in channels]
+    partials = map_tasks(read_digests, [(pk, days[0], days[-1], currencies) for pk in partition_keys])
+    note_query(partitions=partition_keys)
+
+    merged = {}
+    for partial in partials:
+        for currency, digest in partial.items():
+            if currency in merged:
+                merged[currency].merge(digest)
+            else:
+                merged[currency] = digest
+
+    data = {}
+    for currency, digest in sorted(merged.items()):
+        summary = {'count': int(digest.count), 'min': digest.minimum, 'max': digest.maximum}
+        for q in quantiles:
+            summary[quantile_label(q)] = round(digest.quantile(q), 2)
+        data[currency] = summary
+    note_query(rows=len(data))
+
+    metadata = {
+        'first_day': days[0],
+        'last_day': days[-1],
+        'list_type': series,
+        'channels': list(channels),
+    }
+    return data, metadata
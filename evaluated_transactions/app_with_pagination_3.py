@@ -6,9 +6,22 @@ from datetime import datetime, timedelta
 import re
 import math
 import base64
+import heapq
+import time
+from response_encoding import raw_transaction_fragment, make_writer, json_response, RowsWriter, RawWriter
+from http_cache import REVALIDATE, compute_etag, if_none_match, not_modified, with_etag
+from query_planner import choose_plan, is_candidate, plan_filters
+from perf import InstrumentedTable, instrumented_handler, debug_metadata, note_query, phase
+import aggregates_rollup
+import histogram
+import top_entities
+import distinct_entities
+import amount_quantiles
+import rule_stats
+import heatmap
 
 dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE'])
+table = InstrumentedTable(dynamodb.Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE']))
 
 
 
@@ -80,6 +93,41 @@ def get_merchant_product_data(merchant_id: str, product_id: str) -> dict:
 
 PAGE_SIZE = 20  # Default page size
 
+# Column order of a dashboard row; `format=columns|msgpack` emits one array per name
+TRANSACTION_COLUMNS = (
+    'account_ref', 'processor', 'merchant_id', 'product_id', 'transaction_id',
+    'date', 'amount', 'currency', 'country', 'channel', 'name', 'merchant_name',
+    'merchant_product_name', 'evaluation', 'assigned_to', 'relevant_aggregates',
+)
+# Single-transaction lookups do not resolve the case assignee
+SINGLE_TRANSACTION_COLUMNS = tuple(c for c in TRANSACTION_COLUMNS if c != 'assigned_to')
+
+# Live-tail (`since`) mode limits
+TAIL_DEFAULT_LIMIT = 50
+TAIL_MAX_LIMIT = 200
+TAIL_MAX_WAIT_SECONDS = 20       # stays well inside the 29 s API Gateway timeout
+TAIL_POLL_INTERVAL_SECONDS = 1
+TAIL_SAFETY_MARGIN_MS = 2000     # time kept back for building the response
+
+# query_types whose partition is picked by the planner (see query_planner.py)
+PLANNED_QUERY_TYPES = ('', 'all', 'normal', 'affected')
+
+# HTTP caching of past ranges (see past_range_cache_control)
+PAST_RANGE_SETTLE_SECONDS = int(os.environ.get('PAST_RANGE_SETTLE_SECONDS', 3600))
+PAST_RANGE_MAX_AGE = int(os.environ.get('PAST_RANGE_MAX_AGE', 86400))
+IMMUTABLE_MAX_AGE = 31536000
+
+# Analytics endpoints: path -> handle(params, start_timestamp, end_timestamp) -> (data, metadata)
+ANALYTICS_ROUTES = {
+    '/evaluated-transactions/aggregates': aggregates_rollup.handle,
+    '/evaluated-transactions/histogram': histogram.handle,
+    '/evaluated-transactions/top': top_entities.handle,
+    '/evaluated-transactions/distinct': distinct_entities.handle,
+    '/evaluated-transactions/amount-quantiles': amount_quantiles.handle,
+    '/evaluated-transactions/rule-stats': rule_stats.handle,
+    '/evaluated-transactions/heatmap': heatmap.handle,
+}
+
 def parse_key(key, account_id, application_id, merchant_id, product_id):
     parts = key.split('-')
     channel = parts[1]
@@ -175,16 +223,17 @@ def transform_aggregates(relevant_aggregates, account_id, application_id, mercha
         result[category].append(entry)
     return result
 
-def create_pagination_token(last_evaluated_key, current_page, total_records=None, per_page=None):
+def create_pagination_token(last_evaluated_key, current_page, total_records=None, per_page=None, plan=None):
     """
     Return a base-64 encoded pagination token.
 
     Payload:
       {
-        "dynamodb_key": <LastEvaluatedKey>,
+        "dynamodb_key": <LastEvaluatedKey | {partition: last sort key} for fan-out>,
         "next_page":    <next page number>,
         "total_records": <int | null>,
-        "per_page": <int | null>
+        "per_page": <int | null>,
+        "plan": <{"path", "partitions"} | null>
       }
     """
     if not last_evaluated_key:
@@ -196,6 +245,9 @@ def create_pagination_token(last_evaluated_key, current_page, total_records=None
         "total_records": total_records,
         "per_page": per_page,
     }
+    if plan:
+        # Later pages must keep reading the partitions the first page chose
+        token_payload["plan"] = {"path": plan["path"], "partitions": plan["partitions"]}
     return base64.b64encode(json.dumps(token_payload).encode()).decode()
 
 def parse_pagination_token(token):
@@ -203,7 +255,8 @@ def parse_pagination_token(token):
     Decode the base-64 token produced by `create_pagination_token`.
 
     Returns:
-      (ExclusiveStartKey | None, {"page": int, "total_records": int | None, "per_page": int | None})
+      (ExclusiveStartKey | None,
+       {"page": int, "total_records": int | None, "per_page": int | None, "plan": dict | None})
     """
     if not token:
         return None, None
@@ -213,11 +266,12 @@ def parse_pagination_token(token):
             "page": payload.get("next_page", 2),
             "total_records": payload.get("total_records"),
             "per_page": payload.get("per_page"),
+            "plan": payload.get("plan"),
         }
     except Exception:
         return None, None
 
-def get_total_count(partition_key, start_timestamp, end_timestamp, query_params, channel, query_type):
+def get_total_count(partition_key, start_timestamp, end_timestamp, query_params, channel, query_type, entity_filters=None):
     """Get the total count of records matching the query criteria"""
     print("Getting total count...")
     
@@ -228,7 +282,7 @@ def get_total_count(partition_key, start_timestamp, end_timestamp, query_params,
     
     try:
         # If we need to apply additional filtering, we need to scan and count manually
-        if query_type in ['normal', 'affected'] or channel:
+        if query_type in ['normal', 'affected'] or channel or entity_filters:
             # We need to check each item for filtering criteria
             query_kwargs = {
                 'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) & 
@@ -247,23 +301,8 @@ def get_total_count(partition_key, start_timestamp, end_timestamp, query_params,
             
             # Apply filtering and count
             for item in items:
-                processed_transaction = json.loads(item["processed_transaction"]) 
-                original_transaction = processed_transaction["original_transaction"]
-                evaluation = processed_transaction.get('evaluation', {})
-                
-                should_include = True
-                
-                # Apply channel filter
-                if channel and original_transaction.get('channel') != channel:
-                    should_include = False
-                
-                # Apply query_type filter
-                if query_type == 'normal' and evaluation != {}:
-                    should_include = False
-                elif query_type == 'affected' and evaluation == {}:
-                    should_include = False
-                
-                if should_include:
+                processed_transaction = decode_transaction(item)
+                if matches_transaction_filters(processed_transaction, channel, query_type, entity_filters):
                     total_count += 1
         else:
             # For simple queries without filtering, use count query
@@ -321,7 +360,7 @@ def get_entity_list_total_count(partition_key, start_timestamp, end_timestamp, e
         # Count items matching filters
         total_count = 0
         for item in items:
-            processed_transaction = json.loads(item["processed_transaction"])
+            processed_transaction = decode_transaction(item)
             original_transaction = processed_transaction["original_transaction"]
             
             # Apply entity type filter
@@ -348,29 +387,135 @@ def get_entity_list_total_count(partition_key, start_timestamp, end_timestamp, e
         print(f"Error getting entity list total count: {e}")
         return None
 
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+WINDOW_PATTERN = re.compile(r'^(\d+)([smhdw])$')
+
+def resolve_time_range(params, now=None):
+    """
+    Resolve the request's time range into inclusive epoch-second bounds.
+
+    Accepted forms, in order of precedence:
+      - window=15m | 2h | 7d | 1w      relative to now
+      - start_ts=<epoch>[&end_ts=<epoch>]   end defaults to now
+      - start_date=YYYY-MM-DD&end_date=YYYY-MM-DD   whole days, end widened
+                                                    to 23:59:59
+
+    The bounds map straight onto the `{timestamp}_` sort-key range, so a
+    15-minute window only reads the items inside those 15 minutes.
+
+    Returns (None, None) when no range was supplied and raises ValueError for
+    malformed values.
+    """
+    now = int(time.time()) if now is None else now
+    window = params.get('window')
+    start_ts = params.get('start_ts')
+    end_ts = params.get('end_ts')
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    if window:
+        match = WINDOW_PATTERN.match(window.strip().lower())
+        if not match:
+            raise ValueError('window must look like 30s, 15m, 2h, 7d or 1w')
+        return now - int(match.group(1)) * WINDOW_UNITS[match.group(2)], now
+
+    if start_ts or end_ts:
+        if not start_ts:
+            raise ValueError('start_ts is required when end_ts is supplied')
+        try:
+            start_timestamp = int(start_ts)
+            end_timestamp = int(end_ts) if end_ts else now
+        except ValueError:
+            raise ValueError('start_ts and end_ts must be epoch seconds')
+        if end_timestamp < start_timestamp:
+            raise ValueError('end_ts must not be earlier than start_ts')
+        return start_timestamp, end_timestamp
+
+    if start_date and end_date:
+        start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+        end_timestamp = int((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).timestamp() - 1)
+        return start_timestamp, end_timestamp
+
+    return None, None
+
+@instrumented_handler('EvaluatedTransactions')
 def lambda_handler(event, context):
     try:
         print("The event is ", event)
         query_params = event['queryStringParameters'] or {}
         print("The query params are ", query_params)
 
+        analytics_handler = ANALYTICS_ROUTES.get(event.get('path') or event.get('resource'))
+        if analytics_handler:
+            return handle_analytics(analytics_handler, query_params)
+
         # Handle both page-based and token-based pagination
         page = int(query_params.get('page', 1))
         page_size = int(query_params.get('page_size', PAGE_SIZE))
         pagination_token = query_params.get('pagination_token')
         
-        start_date = query_params.get('start_date')
-        end_date = query_params.get('end_date')
         list_type = query_params.get('list_type', '')
         entity_type = query_params.get('entity_type', '')
         channel = query_params.get('channel', '')
         query_type = query_params.get('query_type', '')
+        since = query_params.get('since')
+        view = query_params.get('view', 'rows')
+        fmt = query_params.get('format', 'rows')
+        enrich = query_params.get('enrich', 'true').lower() != 'false'
+        debug = query_params.get('debug', 'false').lower() == 'true'
         
-        if query_type != "single" and (not start_date or not end_date):
-            return response(400, {'message': 'start_date and end_date are required'})
+        if view not in ('rows', 'raw'):
+            return response(400, {'message': 'view must be rows or raw'})
+        if view == 'raw':
+            if fmt != 'rows':
+                return response(400, {'message': 'view=raw only supports format=rows'})
+            writer = RawWriter()
+        else:
+            columns = SINGLE_TRANSACTION_COLUMNS if query_type == 'single' else TRANSACTION_COLUMNS
+            try:
+                writer = make_writer(fmt, columns)
+            except ValueError as e:
+                return response(400, {'message': str(e)})
+        
+        if since:
+            # Live-tail mode: no date range and no total count
+            try:
+                limit = int(query_params.get('limit', TAIL_DEFAULT_LIMIT))
+                wait_seconds = int(query_params.get('wait', 0))
+            except ValueError:
+                return response(400, {'message': 'limit and wait must be integers'})
+            if limit < 1:
+                return response(400, {'message': 'limit must be at least 1'})
+            limit = min(limit, TAIL_MAX_LIMIT)
+            partition_key = construct_partition_key(query_params)
+            result = query_transactions_since(partition_key,
+                                              since,
+                                              channel,
+                                              query_type,
+                                              limit,
+                                              wait_seconds,
+                                              context,
+                                              writer,
+                                              enrich)
+            return render_response(writer, result['metadata'])
+        
+        try:
+            start_timestamp, end_timestamp = resolve_time_range(query_params)
+        except ValueError as e:
+            return response(400, {'message': str(e)})
 
-        start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
-        end_timestamp = int((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).timestamp() - 1)
+        if query_type != "single" and start_timestamp is None:
+            return response(400, {'message': 'start_date and end_date (or start_ts / window) are required'})
+        
+        # Conditional GET for ranges that can no longer change
+        cache_control = None
+        validate_before_read = False
+        if query_type != 'single':
+            cache_control, validate_before_read = past_range_cache_control(end_timestamp, view, enrich)
+        if validate_before_read:
+            etag = compute_etag(query_params)
+            if if_none_match(event, etag):
+                return not_modified(etag, cache_control)
         
         partition_key = construct_partition_key(query_params)
         result = {}
@@ -384,10 +529,24 @@ def lambda_handler(event, context):
                                                          channel,
                                                          page,
                                                          page_size,
-                                                         pagination_token)
+                                                         pagination_token,
+                                                         writer,
+                                                         enrich)
         elif query_type == 'single':
-            items = query_transaction_by_id(partition_key, query_params)
+            items = query_transaction_by_id(partition_key, query_params, writer, enrich)
             result = format_single_response(items, page, page_size)
+        elif query_type in PLANNED_QUERY_TYPES:
+            result = query_planned_transactions(query_params,
+                                                start_timestamp,
+                                                end_timestamp,
+                                                channel,
+                                                query_type,
+                                                page,
+                                                page_size,
+                                                pagination_token,
+                                                writer,
+                                                enrich,
+                                                debug)
         else:
             result = query_transactions(partition_key,
                                       start_timestamp,
@@ -397,14 +556,65 @@ def lambda_handler(event, context):
                                       query_type,
                                       page,
                                       page_size,
-                                      pagination_token)
+                                      pagination_token,
+                                      writer,
+                                      enrich)
         
-        return response(200, result)
+        rendered = render_response(writer, result['metadata'])
+        if cache_control and not validate_before_read:
+            # Enriched rows can change, so only the page itself identifies them
+            etag = compute_etag(rendered['body'])
+            if if_none_match(event, etag):
+                return not_modified(etag, cache_control)
+        if cache_control:
+            return with_etag(rendered, etag, cache_control)
+        return rendered
     
     except Exception as e:
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
 
+def handle_analytics(handler, query_params):
+    """Run an analytics endpoint over the requested time range"""
+    try:
+        start_timestamp, end_timestamp = resolve_time_range(query_params)
+        if start_timestamp is None:
+            raise ValueError('start_date and end_date (or start_ts / window) are required')
+        data, metadata = handler(query_params, start_timestamp, end_timestamp)
+    except ValueError as e:
+        return response(400, {'message': str(e)})
+    metadata.update(debug_metadata())
+    with phase('serialize'):
+        return json_response(200, data, metadata)
+
+def render_response(writer, metadata):
+    """Attach debug metadata and serialise the page (timed as `serialize`)"""
+    note_query(rows=len(writer))
+    metadata.update(debug_metadata())
+    with phase('serialize'):
+        return writer.render(200, metadata)
+
+def past_range_cache_control(end_timestamp, view, enrich, now=None):
+    """
+    Cache policy for a range ending at *end_timestamp*.
+
+    Returns (Cache-Control, validate_before_read), or (None, False) while
+    the range may still receive writes.  Un-enriched pages are built only
+    from stored transactions, which no longer change, so their ETag hashes
+    the request and is checked before reading; raw ones are also immutable.
+    Enriched pages carry the case assignee and merchant names, which can
+    change at any time, so their ETag hashes the rendered page and they are
+    always revalidated.
+    """
+    now = int(time.time()) if now is None else now
+    if end_timestamp is None or end_timestamp > now - PAST_RANGE_SETTLE_SECONDS:
+        return None, False
+    if enrich:
+        return REVALIDATE, False
+    if view == 'raw':
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable", True
+    return f"public, max-age={PAST_RANGE_MAX_AGE}", True
+
 def construct_partition_key(params):
     query_type = params.get('query_type', 'all')
     channel = params.get('channel', '')
@@ -499,9 +709,105 @@ def format_paginated_response(items, current_page, per_page, next_pagination_tok
         }
     }
 
-def query_transactions(partition_key, start_timestamp, end_timestamp, query_params, channel, query_type, page, per_page, pagination_token=None):
+def decode_transaction(item):
+    """Parse the stored `processed_transaction` JSON (timed as `decode`)"""
+    with phase('decode'):
+        return json.loads(item["processed_transaction"])
+
+def matches_transaction_filters(processed_transaction, channel, query_type, entity_filters=None):
+    """Apply the channel, entity and normal/affected filters to a decoded transaction"""
+    original_transaction = processed_transaction["original_transaction"]
+    evaluation = processed_transaction.get('evaluation', {})
+
+    if channel and channel != original_transaction.get('channel'):
+        return False
+    if entity_filters and any(original_transaction.get(field) != value for field, value in entity_filters.items()):
+        return False
+    if query_type == 'normal' and evaluation != {}:
+        return False
+    if query_type == 'affected' and evaluation == {}:
+        return False
+    return True
+
+def build_transaction_item(processed_transaction, include_assignment=True):
+    """Flatten a decoded `processed_transaction` into a dashboard row dict"""
+    columns = TRANSACTION_COLUMNS if include_assignment else SINGLE_TRANSACTION_COLUMNS
+    return dict(zip(columns, build_transaction_values(processed_transaction, include_assignment)))
+
+def build_transaction_values(processed_transaction, include_assignment=True):
+    """
+    Flatten a decoded `processed_transaction` into a tuple ordered like
+    TRANSACTION_COLUMNS (SINGLE_TRANSACTION_COLUMNS without the assignee),
+    enriching it with merchant/product names and (optionally) the case
+    assignee.
+    """
+    original_transaction = processed_transaction["original_transaction"]
+    evaluation = processed_transaction.get('evaluation', {})
+
+    account_id = original_transaction['account_id']
+    application_id = original_transaction['application_id']
+    merchant_id = original_transaction['merchant_id']
+    product_id = original_transaction['product_id']
+    meta = get_merchant_product_data(merchant_id, product_id)
+
+    values = (
+        account_id,
+        application_id,
+        merchant_id,
+        product_id,
+        original_transaction['transaction_id'],
+        original_transaction['date'],
+        original_transaction['amount'],
+        original_transaction['currency'],
+        original_transaction['country'],
+        original_transaction['channel'],
+        original_transaction.get('name', ''),
+        meta.get('merchantName', ''),
+        meta.get('merchantProductName', ''),
+        transform_keys(evaluation),
+    )
+    if include_assignment:
+        values += (assigned_status(original_transaction['transaction_id']),)
+    return values + (
+        transform_aggregates(
+            processed_transaction.get('aggregates', {}),
+            account_id,
+            application_id,
+            merchant_id,
+            product_id
+        ),
+    )
+
+def build_raw_fragment(item, processed_transaction, enrich=True, include_assignment=True):
+    """
+    Raw/detail mode: splice the stored `processed_transaction` JSON into the
+    response untouched and serialise only the sort key and, when *enrich* is
+    set, the assignee and merchant/product names.
+    """
+    enrichment = {'sort_key': item['SORT_KEY']}
+    if enrich and processed_transaction is not None:
+        original_transaction = processed_transaction["original_transaction"]
+        meta = get_merchant_product_data(
+            original_transaction['merchant_id'], original_transaction['product_id']
+        )
+        if include_assignment:
+            enrichment['assigned_to'] = assigned_status(original_transaction['transaction_id'])
+        enrichment['merchant_name'] = meta.get('merchantName', '')
+        enrichment['merchant_product_name'] = meta.get('merchantProductName', '')
+    return raw_transaction_fragment(item["processed_transaction"], enrichment)
+
+def emit_row(writer, item, processed_transaction, enrich=True, include_assignment=True):
+    """Feed one stored item to the response writer in the shape it expects (timed as `enrich`)"""
+    with phase('enrich'):
+        if isinstance(writer, RawWriter):
+            writer.add(build_raw_fragment(item, processed_transaction, enrich, include_assignment))
+        else:
+            writer.add(build_transaction_values(processed_transaction, include_assignment))
+
+def query_transactions(partition_key, start_timestamp, end_timestamp, query_params, channel, query_type, page, per_page, pagination_token=None, writer=None, enrich=True, entity_filters=None, plan=None):
     """Query transactions with proper DynamoDB pagination and consistent metadata"""
     print("Starting query_transactions with proper pagination and consistent metadata")
+    note_query(partitions=[partition_key])
     
     start_sk = f"{start_timestamp}_"
     end_sk = f"{end_timestamp}_z"
@@ -526,6 +832,7 @@ def query_transactions(partition_key, start_timestamp, end_timestamp, query_para
             query_params,
             channel,
             query_type,
+            entity_filters,
         )
     
     # Build query parameters
@@ -540,8 +847,12 @@ def query_transactions(partition_key, start_timestamp, end_timestamp, query_para
     if exclusive_start_key:
         query_kwargs['ExclusiveStartKey'] = exclusive_start_key
     
+    # Raw mode without filters or enrichment never needs to decode the blob
+    decode = (not isinstance(writer, RawWriter) or enrich or channel or entity_filters
+              or query_type in ('normal', 'affected'))
+    
     # Query DynamoDB
-    processed_items = []
+    processed_items = writer if writer is not None else RowsWriter(TRANSACTION_COLUMNS)
     last_evaluated_key = None
     
     while len(processed_items) < per_page:
@@ -553,62 +864,22 @@ def query_transactions(partition_key, start_timestamp, end_timestamp, query_para
             break
         
         # Process and filter items
-        for item in items:
+        for index, item in enumerate(items):
             if len(processed_items) >= per_page:
+                # Page filled mid-batch: resume right after the last row consumed
+                last_evaluated_key = {
+                    'PARTITION_KEY': partition_key,
+                    'SORT_KEY': items[index - 1]['SORT_KEY']
+                }
                 break
                 
-            processed_transaction = json.loads(item["processed_transaction"]) 
-            original_transaction = processed_transaction["original_transaction"]
-            evaluation = processed_transaction.get('evaluation', {})
-            
-            account_id = original_transaction['account_id']
-            application_id = original_transaction['application_id']
-            merchant_id = original_transaction['merchant_id']
-            product_id = original_transaction['product_id']
-            assigned_person = assigned_status(original_transaction['transaction_id'])
-            meta = get_merchant_product_data(merchant_id, product_id)
-            
-            processed_item = {
-                'account_ref': account_id,
-                'processor': application_id,
-                'merchant_id': merchant_id,
-                'product_id': product_id,
-                'transaction_id': original_transaction['transaction_id'],
-                'date': original_transaction['date'],
-                'amount': original_transaction['amount'],
-                'currency': original_transaction['currency'],
-                'country': original_transaction['country'],
-                'channel': original_transaction['channel'],
-                'name': original_transaction.get('name', ''),
-                'merchant_name': meta.get('merchantName', ''),
-                'merchant_product_name': meta.get('merchantProductName', ''),
-                'evaluation': transform_keys(evaluation),
-                'assigned_to': assigned_person,
-                'relevant_aggregates': transform_aggregates(
-                    processed_transaction.get('aggregates', {}), 
-                    account_id, 
-                    application_id, 
-                    merchant_id, 
-                    product_id
-                )
-            }
+            if not decode:
+                processed_items.add(build_raw_fragment(item, None, enrich=False))
+                continue
             
-            # Apply filtering based on query_type and channel
-            should_include = True
-            
-            # Channel filter
-            if channel and channel != processed_item['channel']:
-                should_include = False
-            
-            # Query type filter
-            if should_include:
-                if query_type == 'normal' and processed_item["evaluation"] != {}:
-                    should_include = False
-                elif query_type == 'affected' and processed_item["evaluation"] == {}:
-                    should_include = False
-                    
-            if should_include:
-                processed_items.append(processed_item)
+            processed_transaction = decode_transaction(item)
+            if matches_transaction_filters(processed_transaction, channel, query_type, entity_filters):
+                emit_row(processed_items, item, processed_transaction, enrich)
         
         # If no more items from DynamoDB or we don't have last_evaluated_key, break
         if not last_evaluated_key or not items:
@@ -622,13 +893,232 @@ def query_transactions(partition_key, start_timestamp, end_timestamp, query_para
     next_token = None
     if last_evaluated_key and len(processed_items) == per_page:
         next_token = create_pagination_token(
-            last_evaluated_key, current_page, total_records, per_page
+            last_evaluated_key, current_page, total_records, per_page, plan
         )
     
     return format_paginated_response(processed_items, current_page, per_page, next_token, total_records)
 
-def query_transaction_by_id(partition_key, params):
+def query_planned_transactions(query_params, start_timestamp, end_timestamp, channel, query_type, page, per_page, pagination_token=None, writer=None, enrich=True, debug=False):
+    """
+    `all` / `normal` / `affected` listing: let the planner pick the partition(s)
+    to read, then run the single-partition or fan-out reader.  Later pages
+    reuse the plan stored in the pagination token.
+    """
+    _, token_metadata = parse_pagination_token(pagination_token)
+    plan = (token_metadata or {}).get('plan')
+    if plan and not is_candidate(plan, query_params):
+        # Not a plan these params allow: treat it like an unreadable token
+        plan = pagination_token = None
+    if not plan:
+        plan = choose_plan(table, query_params, start_timestamp, end_timestamp, explain=debug)
+    print(f"Query plan: {plan['path']} over {plan['partitions']}")
+
+    filters = plan_filters(plan, query_params)
+    if len(plan['partitions']) == 1:
+        result = query_transactions(plan['partitions'][0],
+                                    start_timestamp,
+                                    end_timestamp,
+                                    query_params,
+                                    channel,
+                                    query_type,
+                                    page,
+                                    per_page,
+                                    pagination_token,
+                                    writer,
+                                    enrich,
+                                    filters,
+                                    plan)
+    else:
+        result = query_merged_transactions(plan['partitions'],
+                                           start_timestamp,
+                                           end_timestamp,
+                                           query_params,
+                                           channel,
+                                           query_type,
+                                           page,
+                                           per_page,
+                                           pagination_token,
+                                           writer,
+                                           enrich,
+                                           filters,
+                                           plan)
+
+    if debug:
+        result['metadata']['debug'] = {'plan': plan}
+    return result
+
+def query_merged_transactions(partition_keys, start_timestamp, end_timestamp, query_params, channel, query_type, page, per_page, pagination_token=None, writer=None, enrich=True, entity_filters=None, plan=None):
+    """
+    Fan-out variant of query_transactions: read several partitions newest
+    first and merge them by sort key.
+
+    The pagination token stores the last consumed sort key of every partition
+    that still has rows (null for one not read yet), so each page resumes
+    exactly where the previous one stopped.
+    """
+    note_query(partitions=partition_keys)
+    start_sk = f"{start_timestamp}_"
+    end_sk = f"{end_timestamp}_z"
+
+    cursors, token_metadata = parse_pagination_token(pagination_token)
+    current_page = page
+    total_records = None
+
+    if token_metadata:
+        current_page = token_metadata.get('page', current_page)
+        total_records = token_metadata.get('total_records', total_records)
+        per_page = token_metadata.get('per_page', per_page)
+        # Only resume partitions of this plan; the token comes from the client
+        cursors = {
+            partition_key: cursor
+            for partition_key, cursor in (cursors if isinstance(cursors, dict) else {}).items()
+            if partition_key in partition_keys
+        }
+    else:
+        cursors = {partition_key: None for partition_key in partition_keys}
+        counts = [
+            get_total_count(partition_key, start_timestamp, end_timestamp, query_params, channel, query_type, entity_filters)
+            for partition_key in partition_keys
+        ]
+        total_records = None if None in counts else sum(counts)
+
+    exhausted = set()
+
+    def read_partition(partition_key, cursor):
+        query_kwargs = {
+            'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                    Key('SORT_KEY').between(start_sk, end_sk),
+            'ScanIndexForward': False,
+            'Limit': per_page
+        }
+        if cursor:
+            query_kwargs['ExclusiveStartKey'] = {'PARTITION_KEY': partition_key, 'SORT_KEY': cursor}
+        while True:
+            response = table.query(**query_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                # Only reached once every item above has been consumed
+                exhausted.add(partition_key)
+                return
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    streams = [read_partition(partition_key, cursor) for partition_key, cursor in cursors.items()]
+    processed_items = writer if writer is not None else RowsWriter(TRANSACTION_COLUMNS)
+
+    for item in heapq.merge(*streams, key=lambda item: item['SORT_KEY'], reverse=True):
+        cursors[item['PARTITION_KEY']] = item['SORT_KEY']
+        processed_transaction = decode_transaction(item)
+        if matches_transaction_filters(processed_transaction, channel, query_type, entity_filters):
+            emit_row(processed_items, item, processed_transaction, enrich)
+            if len(processed_items) >= per_page:
+                break
+
+    remaining = {
+        partition_key: cursor
+        for partition_key, cursor in cursors.items()
+        if partition_key not in exhausted
+    }
+    next_token = None
+    if remaining and len(processed_items) == per_page:
+        next_token = create_pagination_token(remaining, current_page, total_records, per_page, plan)
+
+    return format_paginated_response(processed_items, current_page, per_page, next_token, total_records)
+
+def query_transactions_since(partition_key, since_key, channel, query_type, limit, wait_seconds=0, context=None, writer=None, enrich=True):
+    """
+    Live-tail mode: return only the transactions whose SORT_KEY is strictly
+    greater than *since_key* (the newest key the client has already seen).
+
+    No total count is computed, so a steady-state poll costs a single narrow
+    range query.  When nothing new has arrived and *wait_seconds* > 0 the
+    range query is repeated every TAIL_POLL_INTERVAL_SECONDS until a row shows
+    up or the wait (bounded by the Lambda's remaining time) runs out.
+
+    The returned `cursor` is the key to send as `since` on the next poll.  It
+    advances past rows removed by the channel / query_type filters so that
+    they are not re-read, and `has_more` signals that the cap was hit and the
+    client should poll again immediately.
+    """
+    note_query(partitions=[partition_key])
+    deadline = time.time() + min(max(wait_seconds, 0), TAIL_MAX_WAIT_SECONDS)
+    if context is not None:
+        remaining_ms = context.get_remaining_time_in_millis() - TAIL_SAFETY_MARGIN_MS
+        deadline = min(deadline, time.time() + remaining_ms / 1000.0)
+
+    cursor = since_key
+    while True:
+        matches, cursor, has_more = read_transactions_after(
+            partition_key, cursor, channel, query_type, limit
+        )
+        if matches or has_more:
+            break
+        if time.time() + TAIL_POLL_INTERVAL_SECONDS >= deadline:
+            break
+        time.sleep(TAIL_POLL_INTERVAL_SECONDS)
+
+    # Newest first, consistent with the paginated listing
+    processed_items = writer if writer is not None else RowsWriter(TRANSACTION_COLUMNS)
+    for item, processed_transaction in reversed(matches):
+        emit_row(processed_items, item, processed_transaction, enrich)
+
+    return {
+        'data': processed_items,
+        'metadata': {
+            'since': since_key,
+            'cursor': cursor,
+            'count': len(processed_items),
+            'has_more': has_more,
+            'per_page': limit,
+            'pagination_token': None
+        }
+    }
+
+def read_transactions_after(partition_key, since_key, channel, query_type, limit):
+    """
+    Read forward from *since_key* until *limit* matching rows are collected or
+    the partition is exhausted.
+
+    Returns ([(item, processed_transaction), ...] oldest first,
+             last_consumed_sort_key, has_more).
+    """
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').gt(since_key),
+        'ScanIndexForward': True,
+        'Limit': limit
+    }
+
+    matches = []
+    cursor = since_key
+    has_more = False
+
+    while True:
+        response = table.query(**query_kwargs)
+        items = response.get('Items', [])
+        last_evaluated_key = response.get('LastEvaluatedKey')
+
+        for item in items:
+            if len(matches) >= limit:
+                has_more = True
+                break
+            cursor = item['SORT_KEY']
+            processed_transaction = decode_transaction(item)
+            if matches_transaction_filters(processed_transaction, channel, query_type):
+                matches.append((item, processed_transaction))
+
+        if has_more or not last_evaluated_key:
+            break
+        if len(matches) >= limit:
+            has_more = True
+            break
+
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+    return matches, cursor, has_more
+
+def query_transaction_by_id(partition_key, params, writer=None, enrich=True):
     """Query a single transaction by ID"""
+    note_query(partitions=[partition_key])
     response = table.query(
         KeyConditionExpression=Key('PARTITION_KEY').eq(partition_key) & 
         Key('SORT_KEY').eq(params.get("transaction_id"))
@@ -640,47 +1130,20 @@ def query_transaction_by_id(partition_key, params):
     if 'Item' in response:
         items = [response['Item']]
 
-    processed_items = []
+    processed_items = writer if writer is not None else RowsWriter(SINGLE_TRANSACTION_COLUMNS)
     for item in items:
-        processed_transaction = json.loads(item["processed_transaction"]) 
-        original_transaction = processed_transaction["original_transaction"]
-        evaluation = processed_transaction.get('evaluation', {})
-        account_id = original_transaction['account_id']
-        application_id = original_transaction['application_id']
-        merchant_id = original_transaction['merchant_id']
-        product_id = original_transaction['product_id']
-        meta = get_merchant_product_data(merchant_id, product_id)
-        
-        processed_item = {
-            'account_ref': account_id,
-            'processor': application_id,
-            'merchant_id': merchant_id,
-            'product_id': product_id,
-            'transaction_id': original_transaction['transaction_id'],
-            'date': original_transaction['date'],
-            'amount': original_transaction['amount'],
-            'currency': original_transaction['currency'],
-            'country': original_transaction['country'],
-            'channel': original_transaction['channel'],
-            'name': original_transaction.get('name', ''),
-            'merchant_name': meta.get('merchantName', ''),
-            'merchant_product_name': meta.get('merchantProductName', ''),
-            'evaluation': transform_keys(evaluation),
-            'relevant_aggregates': transform_aggregates(
-                processed_transaction.get('aggregates', {}),
-                account_id,
-                application_id,
-                merchant_id,
-                product_id
-            )
-        }
-        processed_items.append(processed_item)
+        if isinstance(processed_items, RawWriter) and not enrich:
+            processed_items.add(build_raw_fragment(item, None, enrich=False))
+            continue
+        processed_transaction = decode_transaction(item)
+        emit_row(processed_items, item, processed_transaction, enrich, include_assignment=False)
     
     return processed_items
 
-def query_transactions_by_entity_and_list(start_timestamp, end_timestamp, list_type, entity_type, query_type, channel, page, per_page, pagination_token=None):
+def query_transactions_by_entity_and_list(start_timestamp, end_timestamp, list_type, entity_type, query_type, channel, page, per_page, pagination_token=None, writer=None, enrich=True):
     """Query transactions by entity and list with consistent metadata"""
     partition_key = f"EVALUATED-{list_type.upper()}"
+    note_query(partitions=[partition_key])
     start_sk = f"{start_timestamp}_"
     end_sk = f"{end_timestamp}_z"
     
@@ -716,7 +1179,7 @@ def query_transactions_by_entity_and_list(start_timestamp, end_timestamp, list_t
         query_kwargs['ExclusiveStartKey'] = exclusive_start_key
     
     # Query and process items
-    processed_items = []
+    processed_items = writer if writer is not None else RowsWriter(TRANSACTION_COLUMNS)
     last_evaluated_key = None
     
     while len(processed_items) < per_page:
@@ -731,7 +1194,7 @@ def query_transactions_by_entity_and_list(start_timestamp, end_timestamp, list_t
             if len(processed_items) >= per_page:
                 break
                 
-            processed_transaction = json.loads(item["processed_transaction"])
+            processed_transaction = decode_transaction(item)
             original_transaction = processed_transaction["original_transaction"]
             
             # Apply entity type filter
@@ -749,39 +1212,7 @@ def query_transactions_by_entity_and_list(start_timestamp, end_timestamp, list_t
             channel_match = not channel or original_transaction.get('channel') == channel
             
             if entity_match and channel_match:
-                evaluation = processed_transaction.get('evaluation', {})
-                account_id = original_transaction['account_id']
-                application_id = original_transaction['application_id']
-                merchant_id = original_transaction['merchant_id']
-                product_id = original_transaction['product_id']
-                assigned_person = assigned_status(original_transaction['transaction_id'])
-                meta = get_merchant_product_data(merchant_id, product_id)
-                
-                processed_item = {
-                    'account_ref': account_id,
-                    'processor': application_id,
-                    'merchant_id': merchant_id,
-                    'product_id': product_id,
-                    'transaction_id': original_transaction['transaction_id'],
-                    'date': original_transaction['date'],
-                    'amount': original_transaction['amount'],
-                    'currency': original_transaction['currency'],
-                    'country': original_transaction['country'],
-                    'channel': original_transaction['channel'],
-                    'name': original_transaction.get('name', ''),
-                    'merchant_name': meta.get('merchantName', ''),
-                    'merchant_product_name': meta.get('merchantProductName', ''),
-                    'evaluation': transform_keys(evaluation),
-                    'assigned_to': assigned_person,
-                    'relevant_aggregates': transform_aggregates(
-                        processed_transaction.get('aggregates', {}),
-                        account_id,
-                        application_id,
-                        merchant_id,
-                        product_id
-                    )
-                }
-                processed_items.append(processed_item)
+                emit_row(processed_items, item, processed_transaction, enrich)
         
         # If no more items from DynamoDB, break
         if not last_evaluated_key or not items:
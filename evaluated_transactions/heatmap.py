@@ -0,0 +1,128 @@
+"""
+GET /evaluated-transactions/heatmap
+
+Activity of one entity partition (`EVALUATED-<channel>-MERCHANT-...` etc.)
+as a day x hour-of-day matrix of counts and amount sums, plus the same data
+folded into a 7 x 24 hour-of-week profile.
+
+Sort-key timestamps and amounts are collected a page at a time and added
+into preallocated flat `array`s indexed `day * 24 + hour`.  A year of
+history is 366 x 24 cells whatever the transaction count.
+"""
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import Key
+
+from query_planner import entity_partition
+from streaming import extract_field, map_ranges, thread_table, TRANSACTION_PROJECTION
+from perf import note_query
+
+MAX_DAYS = 366
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+class Matrix:
+    """`rows` x 24 counts and sums in flat arrays"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.counts = array('L', bytes(array('L').itemsize * rows * 24))
+        self.sums = array('d', bytes(array('d').itemsize * rows * 24))
+
+    def add_batch(self, cells, amounts):
+        counts, sums = self.counts, self.sums
+        for cell, amount in zip(cells, amounts):
+            counts[cell] += 1
+            sums[cell] += amount
+
+    def merge(self, other):
+        for cell, count in enumerate(other.counts):
+            if count:
+                self.counts[cell] += count
+                self.sums[cell] += other.sums[cell]
+
+    def folded(self, row_index, rows):
+        """Sum rows into a `Matrix(rows)`; *row_index[r]* is the target row of row r"""
+        target = Matrix(rows)
+        for row, destination in enumerate(row_index):
+            for hour in range(24):
+                target.counts[destination * 24 + hour] += self.counts[row * 24 + hour]
+                target.sums[destination * 24 + hour] += self.sums[row * 24 + hour]
+        return target
+
+    def to_lists(self):
+        counts = [int(c) for c in self.counts]
+        sums = [round(float(s), 2) for s in self.sums]
+        return (
+            [counts[row * 24:(row + 1) * 24] for row in range(self.rows)],
+            [sums[row * 24:(row + 1) * 24] for row in range(self.rows)],
+        )
+
+
+def handle(params, start_timestamp, end_timestamp):
+    """Return `(data, metadata)`; invalid parameters raise ValueError"""
+    partition_key = entity_partition(params)
+    if partition_key is None:
+        raise ValueError('channel and account_ref or processor are required')
+
+    origin = start_timestamp - start_timestamp % 86400
+    days = (end_timestamp - origin) // 86400 + 1
+    if days > MAX_DAYS:
+        raise ValueError(f"Range too large: {days} days (max {MAX_DAYS})")
+
+    def worker(partition_key, lower, upper):
+        matrix = Matrix(days)
+        query_kwargs = {
+            'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                    Key('SORT_KEY').between(f"{lower}_", f"{upper}_z"),
+            'ProjectionExpression': TRANSACTION_PROJECTION,
+        }
+        transactions = 0
+        while True:
+            response = thread_table().query(**query_kwargs)
+            items = response.get('Items', [])
+            transactions += len(items)
+            # (timestamp - origin) // 3600 is exactly day * 24 + hour
+            cells = [(int(item['SORT_KEY'].split('_', 1)[0]) - origin) // 3600 for item in items]
+            amounts = [
+                float(extract_field(item['processed_transaction'], 'original_transaction', {}).get('amount') or 0)
+                for item in items
+            ]
+            matrix.add_batch(cells, amounts)
+            if 'LastEvaluatedKey' not in response:
+                return matrix, transactions
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    partials = map_ranges(worker, [partition_key], start_timestamp, end_timestamp)
+    note_query(partitions=[partition_key])
+
+    matrix = Matrix(days)
+    transactions = 0
+    for partial, count in partials:
+        matrix.merge(partial)
+        transactions += count
+
+    first_day = datetime.fromtimestamp(origin, tz=timezone.utc)
+    day_labels = [(first_day + timedelta(days=row)).strftime('%Y-%m-%d') for row in range(days)]
+    weekly = matrix.folded([(first_day + timedelta(days=row)).weekday() for row in range(days)], 7)
+
+    counts, amounts = matrix.to_lists()
+    weekly_counts, weekly_amounts = weekly.to_lists()
+    data = {
+        'days': day_labels,
+        'counts': counts,
+        'amounts': amounts,
+        'hour_of_week': {
+            'weekdays': list(WEEKDAYS),
+            'counts': weekly_counts,
+            'amounts': weekly_amounts,
+        },
+    }
+    note_query(rows=days)
+
+    metadata = {
+        'partition': partition_key,
+        'transactions_read': transactions,
+    }
+    return data, metadata
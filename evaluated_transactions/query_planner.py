@@ -0,0 +1,184 @@
+"""
+Access-path planner for `query_type=all|normal|affected`.
+
+Every evaluated transaction is written to the global `EVALUATED` partition
+and to one partition per entity level and channel
+(`EVALUATED-<channel>-ACCOUNT-<id>`, `...-APPLICATION-...`, ...).  Reading the global partition and
+filtering afterwards is always correct but can read far more items than a
+narrower partition would, e.g. `channel=card&account_ref=A1` only needs
+`EVALUATED-card-ACCOUNT-A1`.
+
+Candidate paths:
+
+  - global   `EVALUATED`
+  - entity   one entity partition              (entity filter + `channel`)
+  - fanout   the entity partition of every PLANNER_FANOUT_CHANNELS channel,
+             merged by sort key (entity filter without `channel`)
+
+Each candidate is costed as the number of items its partitions hold inside
+the requested time range, estimated from a small `Select=COUNT` sample and
+cached for a few minutes.  The cheapest wins.  The global path ignores the
+entity params, as these query types always did; an entity or fan-out read
+applies every supplied entity param to each row (`plan_filters()`).  Fan-out
+is only a candidate when the deployment declares, in PLANNER_FANOUT_CHANNELS,
+the closed set of channels transactions are written with; otherwise a
+transaction on any other channel would be missing from its answer, so the
+default (unset) never fans out.  `list_type` plays no part: these
+query types never read a list partition (`entity_list` does).
+"""
+import os
+import time
+
+from boto3.dynamodb.conditions import Key
+
+# The complete set of channels ever written, e.g. "card,wallet,bank"; empty
+# disables fan-out because the channel set is then not known to be closed
+FANOUT_CHANNELS = tuple(
+    channel.strip() for channel in os.environ.get('PLANNER_FANOUT_CHANNELS', '').split(',') if channel.strip()
+)
+
+# Most selective entity level first: (partition label, required params)
+ENTITY_LEVELS = (
+    ('PRODUCT', ('processor', 'merchant_id', 'product_id')),
+    ('MERCHANT', ('processor', 'merchant_id')),
+    ('APPLICATION', ('processor',)),
+    ('ACCOUNT', ('account_ref',)),
+)
+
+# Request parameter -> `original_transaction` field
+ENTITY_FILTER_FIELDS = {
+    'account_ref': 'account_id',
+    'processor': 'application_id',
+    'merchant_id': 'merchant_id',
+    'product_id': 'product_id',
+}
+
+ESTIMATE_SAMPLE_SIZE = 25
+ESTIMATE_TTL_SECONDS = 300
+
+# (partition_key, start_timestamp, end_timestamp) -> (expires_at, estimate)
+_ESTIMATE_CACHE = {}
+
+
+def entity_filters(params):
+    """`original_transaction` field -> required value, for the entity params supplied"""
+    return {
+        field: params[name]
+        for name, field in ENTITY_FILTER_FIELDS.items()
+        if params.get(name)
+    }
+
+
+def plan_filters(plan, params):
+    """
+    Entity filters for the rows read by *plan*: none on the global path, so
+    its results are unchanged; every supplied entity param otherwise
+    """
+    return {} if plan['path'] == 'global' else entity_filters(params)
+
+
+def entity_partition_key(channel, level, params):
+    if level == 'ACCOUNT':
+        entity_id = params['account_ref']
+    elif level == 'APPLICATION':
+        entity_id = params['processor']
+    elif level == 'MERCHANT':
+        entity_id = f"{params['processor']}__{params['merchant_id']}"
+    else:
+        entity_id = f"{params['processor']}__{params['merchant_id']}__{params['product_id']}"
+    return f"EVALUATED-{channel}-{level}-{entity_id}"
+
+
+def entity_partition(params):
+    """The most specific entity partition named by *params* (needs `channel`), or None"""
+    channel = params.get('channel')
+    if not channel:
+        return None
+    for level, required in ENTITY_LEVELS:
+        if all(params.get(name) for name in required):
+            return entity_partition_key(channel, level, params)
+    return None
+
+
+def candidate_plans(params):
+    """All access paths that can answer *params*, global first"""
+    plans = [{'path': 'global', 'partitions': ['EVALUATED']}]
+    channel = params.get('channel')
+    for level, required in ENTITY_LEVELS:
+        if not all(params.get(name) for name in required):
+            continue
+        if channel:
+            plans.append({'path': 'entity', 'partitions': [entity_partition_key(channel, level, params)]})
+        elif FANOUT_CHANNELS:
+            plans.append({
+                'path': 'fanout',
+                'partitions': [entity_partition_key(c, level, params) for c in FANOUT_CHANNELS],
+            })
+    return plans
+
+
+def is_candidate(plan, params):
+    """
+    Whether *plan*, e.g. read back from a client's pagination token, is one
+    of the `candidate_plans(params)`; anything else could name any partition
+    """
+    if not isinstance(plan, dict):
+        return False
+    return any(
+        plan.get('path') == candidate['path'] and plan.get('partitions') == candidate['partitions']
+        for candidate in candidate_plans(params)
+    )
+
+
+def estimate_partition_items(table, partition_key, start_timestamp, end_timestamp):
+    """
+    Estimate the items *partition_key* holds in the time range.
+
+    Counts up to ESTIMATE_SAMPLE_SIZE items from the start of the range; if
+    the sample does not reach the end, the count is extrapolated over the
+    full range from the span the sample covered.
+    """
+    cache_key = (partition_key, start_timestamp, end_timestamp)
+    cached = _ESTIMATE_CACHE.get(cache_key)
+    if cached and cached[0] > time.time():
+        return cached[1]
+
+    response = table.query(
+        KeyConditionExpression=Key('PARTITION_KEY').eq(partition_key) &
+                               Key('SORT_KEY').between(f"{start_timestamp}_", f"{end_timestamp}_z"),
+        Select='COUNT',
+        Limit=ESTIMATE_SAMPLE_SIZE
+    )
+    estimate = response.get('Count', 0)
+    last_evaluated_key = response.get('LastEvaluatedKey')
+    if last_evaluated_key:
+        covered = int(last_evaluated_key['SORT_KEY'].split('_')[0]) - start_timestamp + 1
+        # Nothing has been written after "now", so don't extrapolate into it
+        span = min(end_timestamp, int(time.time())) - start_timestamp + 1
+        estimate = max(estimate, int(estimate * span / max(covered, 1)))
+
+    _ESTIMATE_CACHE[cache_key] = (time.time() + ESTIMATE_TTL_SECONDS, estimate)
+    return estimate
+
+
+def choose_plan(table, params, start_timestamp, end_timestamp, explain=False):
+    """
+    Pick the candidate with the fewest estimated items.
+
+    A lone candidate is returned without estimating unless *explain* is set
+    (debug output).  The chosen plan carries `estimated_items` and, with
+    *explain*, the costed list of all `candidates`.
+    """
+    plans = candidate_plans(params)
+    if len(plans) == 1 and not explain:
+        return dict(plans[0], estimated_items=None)
+
+    for plan in plans:
+        plan['estimated_items'] = sum(
+            estimate_partition_items(table, partition_key, start_timestamp, end_timestamp)
+            for partition_key in plan['partitions']
+        )
+    chosen = dict(min(plans, key=lambda plan: plan['estimated_items']))
+    if explain:
+        chosen['candidates'] = plans
+    return chosen
@@ -0,0 +1,82 @@
+"""
+GET /evaluated-transactions/rule-stats
+
+How often each evaluation key (rule) fired, per channel, over a range.
+
+Affected transactions are the `EVALUATED` items with a non-empty
+`evaluation`; the handler streams that partition in parallel time slices
+and decodes only the `evaluation` and `original_transaction` fields of each
+blob (the `aggregates` map is never parsed).  Keys are reported with the
+same renaming as `transform_keys()` (`application` -> `processor`).
+"""
+from streaming import iter_items, map_ranges, extract_field
+from perf import note_query
+
+
+def rule_name(key):
+    return key.replace('application', 'processor')
+
+
+def count_hits(partition_key, start_timestamp, end_timestamp, channel):
+    """Worker: `({(rule, channel): hits}, {channel: affected}, transactions read)`"""
+    hits = {}
+    affected = {}
+    transactions = 0
+    for item in iter_items(partition_key, start_timestamp, end_timestamp):
+        transactions += 1
+        blob = item['processed_transaction']
+        evaluation = extract_field(blob, 'evaluation', {})
+        if not evaluation:
+            continue
+        transaction_channel = extract_field(blob, 'original_transaction', {}).get('channel', '')
+        if channel and transaction_channel != channel:
+            continue
+        affected[transaction_channel] = affected.get(transaction_channel, 0) + 1
+        for key in evaluation:
+            hit = (rule_name(key), transaction_channel)
+            hits[hit] = hits.get(hit, 0) + 1
+    return hits, affected, transactions
+
+
+def handle(params, start_timestamp, end_timestamp):
+    """Return `(data, metadata)`"""
+    channel = params.get('channel', '')
+
+    def worker(partition_key, lower, upper):
+        return count_hits(partition_key, lower, upper, channel)
+
+    partials = map_ranges(worker, ['EVALUATED'], start_timestamp, end_timestamp)
+    note_query(partitions=['EVALUATED'])
+
+    rules = {}
+    affected = {}
+    transactions = 0
+    for slice_hits, slice_affected, slice_transactions in partials:
+        transactions += slice_transactions
+        for name, count in slice_affected.items():
+            affected[name] = affected.get(name, 0) + count
+        for (rule, rule_channel), count in slice_hits.items():
+            channels = rules.setdefault(rule, {})
+            channels[rule_channel] = channels.get(rule_channel, 0) + count
+
+    total_affected = sum(affected.values())
+    data = sorted(
+        (
+            {
+                'rule': rule,
+                'hits': sum(channels.values()),
+                'share': round(sum(channels.values()) / total_affected, 4) if total_affected else 0,
+                'channels': dict(sorted(channels.items())),
+            }
+            for rule, channels in rules.items()
+        ),
+        key=lambda row: (-row['hits'], row['rule'])
+    )
+    note_query(rows=len(data))
+
+    metadata = {
+        'transactions_read': transactions,
+        'affected_transactions': total_affected,
+        'affected_by_channel': dict(sorted(affected.items())),
+    }
+    return data, metadata
@@ -0,0 +1,145 @@
+"""
+Scheduled rollup that (re)builds the per-day sketches described in
+`sketches.py`.
+
+Each run rebuilds today and yesterday (UTC), so late writes around midnight
+are picked up and the previous day is final once today's first run after
+midnight completes.  Backfill by invoking with
+
+    {"days": ["2025-07-01", "2025-07-02"]}
+or  {"start_day": "2025-07-01", "end_day": "2025-07-31"}
+
+Rebuilding a day overwrites its items, so runs are idempotent.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sketches import (
+    ALL_CHANNELS, CARDINALITY_FIELDS, HyperLogLog, TDigest, day_bounds, days_between,
+    sketch_partition_key,
+)
+from streaming import LIST_TYPES, extract_field, iter_items, map_ranges, thread_table
+
+
+def days_from_event(event):
+    event = event or {}
+    if event.get('days'):
+        return list(event['days'])
+    if event.get('start_day'):
+        start, _ = day_bounds(event['start_day'])
+        _, end = day_bounds(event.get('end_day', event['start_day']))
+        return days_between(start, end)
+    today = datetime.now(timezone.utc).date()
+    return [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+
+
+def sketch_slice(partition_key, start_timestamp, end_timestamp):
+    """
+    Worker for one partition slice, returning
+
+        ({(series, channel): {field: HyperLogLog}},
+         {(series, channel, currency): TDigest of amounts})
+
+    `EVALUATED` feeds ALL and AFFECTED; a list partition feeds its list type.
+    """
+    list_series = None if partition_key == 'EVALUATED' else partition_key.split('-', 1)[1]
+    cardinality = {}
+    amounts = {}
+
+    def sketches_for(series, channel):
+        group = cardinality.get((series, channel))
+        if group is None:
+            group = cardinality[(series, channel)] = {field: HyperLogLog() for field in CARDINALITY_FIELDS}
+        return group
+
+    def digest_for(series, channel, currency):
+        digest = amounts.get((series, channel, currency))
+        if digest is None:
+            digest = amounts[(series, channel, currency)] = TDigest()
+        return digest
+
+    for item in iter_items(partition_key, start_timestamp, end_timestamp):
+        blob = item['processed_transaction']
+        original_transaction = extract_field(blob, 'original_transaction', {})
+        channel = original_transaction.get('channel', '')
+        if list_series:
+            series = [list_series]
+        else:
+            series = ['ALL']
+            if extract_field(blob, 'evaluation', {}):
+                series.append('AFFECTED')
+        for name in series:
+            sketches = sketches_for(name, channel)
+            for field, source in CARDINALITY_FIELDS.items():
+                value = original_transaction.get(source)
+                if value:
+                    sketches[field].add(value)
+        amount = original_transaction.get('amount')
+        if amount is not None:
+            currency = original_transaction.get('currency', '')
+            for name in series:
+                digest_for(name, channel, currency).add(float(amount))
+    return cardinality, amounts
+
+
+def rollup_day(day):
+    """Build and store every sketch of *day*; returns the number of items written"""
+    start_timestamp, end_timestamp = day_bounds(day)
+    partition_keys = ['EVALUATED'] + [f"EVALUATED-{list_type}" for list_type in LIST_TYPES]
+
+    cardinality = {}
+    amounts = {}
+    for slice_cardinality, slice_amounts in map_ranges(sketch_slice, partition_keys, start_timestamp, end_timestamp):
+        for key, sketches in slice_cardinality.items():
+            if key not in cardinality:
+                cardinality[key] = sketches
+            else:
+                for field, sketch in sketches.items():
+                    cardinality[key][field].merge(sketch)
+        for key, digest in slice_amounts.items():
+            if key not in amounts:
+                amounts[key] = digest
+            else:
+                amounts[key].merge(digest)
+
+    # The union over channels, for readers that don't filter by channel
+    for (series, channel), sketches in list(cardinality.items()):
+        union = cardinality.get((series, ALL_CHANNELS))
+        if union is None:
+            union = cardinality[(series, ALL_CHANNELS)] = {field: HyperLogLog() for field in CARDINALITY_FIELDS}
+        for field, sketch in sketches.items():
+            union[field].merge(sketch)
+    for (series, channel, currency), digest in list(amounts.items()):
+        union = amounts.get((series, ALL_CHANNELS, currency))
+        if union is None:
+            union = amounts[(series, ALL_CHANNELS, currency)] = TDigest()
+        union.merge(digest)
+
+    table = thread_table()
+    updated_at = datetime.now(timezone.utc).isoformat()
+    for (series, channel), sketches in cardinality.items():
+        item = {
+            'PARTITION_KEY': sketch_partition_key('HLL', series, channel),
+            'SORT_KEY': day,
+            'updated_at': updated_at,
+        }
+        for field, sketch in sketches.items():
+            item[field] = sketch.to_bytes()
+        table.put_item(Item=item)
+    for (series, channel, currency), digest in amounts.items():
+        table.put_item(Item={
+            'PARTITION_KEY': sketch_partition_key('TDIGEST', series, channel),
+            'SORT_KEY': f"{day}#{currency}",
+            'amount': digest.to_bytes(),
+            'transactions': int(digest.count),
+            'updated_at': updated_at,
+        })
+    return len(cardinality) + len(amounts)
+
+
+def lambda_handler(event, context):
+    days = days_from_event(event)
+    written = {}
+    for day in days:
+        written[day] = rollup_day(day)
+        print(f"Sketch rollup for {day}: {written[day]} items")
+    return {'days': days, 'items_written': written}
@@ -0,0 +1,228 @@
+"""
+Mergeable per-day sketches of evaluated transactions.
+
+`sketch_rollup.py` builds them on a schedule and stores them in
+FRAUD_PROCESSED_TRANSACTIONS_TABLE:
+
+    PARTITION_KEY = "SKETCH-HLL-<SERIES>-<channel>"
+    SORT_KEY      = "YYYY-MM-DD"
+    account_ref / merchant_id / processor   Binary (serialised HyperLogLog)
+
+    PARTITION_KEY = "SKETCH-TDIGEST-<SERIES>-<channel>"
+    SORT_KEY      = "YYYY-MM-DD#<currency>"
+    amount                                  Binary (serialised TDigest)
+
+where SERIES is ALL (every evaluated transaction), AFFECTED (non-empty
+evaluation) or a list type, and channel is the transaction's channel or
+ALL_CHANNELS (`*`), the union of every channel seen that day.  Readers query
+one partition per (series, channel) for a range of days and merge the
+sketches, so the cost is O(days), independent of transaction volume.
+"""
+import hashlib
+import math
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from streaming import LIST_TYPES
+
+SERIES = ('ALL', 'AFFECTED') + LIST_TYPES
+
+# Channel label of the sketches covering every channel; the channel set is
+# open, so readers without a `channel` filter use these instead of a list
+ALL_CHANNELS = '*'
+
+# Sketched field -> `original_transaction` field
+CARDINALITY_FIELDS = {
+    'account_ref': 'account_id',
+    'merchant_id': 'merchant_id',
+    'processor': 'application_id',
+}
+
+HLL_PRECISION = 12  # 4096 registers, ~1.6 % standard error
+
+TDIGEST_COMPRESSION = 200  # ~compression / 2 centroids, ~2 KB serialised
+TDIGEST_BUFFER = 500
+
+
+def sketch_partition_key(kind, series, channel):
+    return f"SKETCH-{kind}-{series}-{channel}"
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def day_bounds(day):
+    """Inclusive epoch bounds of a UTC day (`YYYY-MM-DD`)"""
+    start = int(datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+    return start, start + 86399
+
+
+def days_between(start_timestamp, end_timestamp):
+    """Every UTC day touched by the range, oldest first"""
+    day = datetime.fromtimestamp(start_timestamp, tz=timezone.utc).date()
+    last = datetime.fromtimestamp(end_timestamp, tz=timezone.utc).date()
+    days = []
+    while day <= last:
+        days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def binary_value(value):
+    """boto3 returns Binary attributes wrapped in `boto3.dynamodb.types.Binary`"""
+    return bytes(getattr(value, 'value', value))
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over a 64-bit blake2b hash"""
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        registers = self.registers
+        for index, rank in enumerate(other.registers):
+            if rank > registers[index]:
+                registers[index] = rank
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """One precision byte followed by the zlib-compressed registers"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = binary_value(data)
+        return cls(data[0], bytearray(zlib.decompress(data[1:])))
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl): values are buffered, then folded into
+    weighted centroids whose size shrinks towards both tails (k1 scale
+    function), so p99 stays accurate with a fixed number of centroids.
+    """
+
+    __slots__ = ('compression', 'centroids', 'buffer', 'minimum', 'maximum')
+
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.centroids = []  # [(mean, weight)] sorted by mean
+        self.buffer = []
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value, weight=1.0):
+        self.buffer.append((value, weight))
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        if len(self.buffer) >= TDIGEST_BUFFER:
+            self.compress()
+
+    def merge(self, other):
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.compress()
+        return self
+
+    @property
+    def count(self):
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self.buffer)
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        k = min(k, self.compression / 4)
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in points)
+        merged = []
+        mean, weight = points[0]
+        so_far = 0.0
+        limit = total * self._q(self._k(0) + 1)
+        for point_mean, point_weight in points[1:]:
+            if so_far + weight + point_weight <= limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                so_far += weight
+                limit = total * self._q(self._k(so_far / total) + 1)
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Interpolated value at quantile *q* (0..1), or None when empty"""
+        self.compress()
+        centroids = self.centroids
+        if not centroids:
+            return None
+        if len(centroids) == 1:
+            return centroids[0][0]
+        total = sum(w for _, w in centroids)
+        index = q * total
+        first_mean, first_weight = centroids[0]
+        if index < first_weight / 2:
+            return self.minimum + (first_mean - self.minimum) * index / (first_weight / 2)
+        cumulative = 0.0
+        for (left_mean, left_weight), (right_mean, right_weight) in zip(centroids, centroids[1:]):
+            left_center = cumulative + left_weight / 2
+            right_center = cumulative + left_weight + right_weight / 2
+            if index <= right_center:
+                fraction = (index - left_center) / (right_center - left_center)
+                return left_mean + (right_mean - left_mean) * fraction
+            cumulative += left_weight
+        last_mean, last_weight = centroids[-1]
+        fraction = (index - (total - last_weight / 2)) / (last_weight / 2)
+        return last_mean + (self.maximum - last_mean) * min(fraction, 1.0)
+
+    def to_bytes(self):
+        """`<compression, min, max, n>` then n (mean, weight) double pairs"""
+        self.compress()
+        flat = [value for centroid in self.centroids for value in centroid]
+        return struct.pack(f'<dddI{len(flat)}d', self.compression, self.minimum, self.maximum,
+                           len(self.centroids), *flat)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = binary_value(data)
+        compression, minimum, maximum, n = struct.unpack_from('<dddI', data)
+        flat = struct.unpack_from(f'<{2 * n}d', data, struct.calcsize('<dddI'))
+        digest = cls(compression)
+        digest.minimum, digest.maximum = minimum, maximum
+        digest.centroids = list(zip(flat[0::2], flat[1::2]))
+        return digest
@@ -0,0 +1,137 @@
+"""
+Streaming reads shared by the `/evaluated-transactions/*` analytics endpoints.
+
+The analytics endpoints fold every item of a time range into a small
+accumulator instead of building response rows, so they only need:
+
+  - `iter_items()`      a generator over one partition's items in a range,
+                        page by page, with a projection
+  - `map_ranges()`      the same work fanned out over time slices (and
+                        partitions) on a thread pool; the caller merges the
+                        partial results
+  - `extract_field()`   decode a single top-level field of the stored
+                        `processed_transaction` JSON without parsing the rest
+                        (the `aggregates` map is most of each blob)
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from perf import InstrumentedTable
+
+TABLE_NAME = os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE']
+
+MAX_WORKERS = int(os.environ.get('ANALYTICS_MAX_WORKERS', 8))
+DEFAULT_SLICES = 4
+
+# DynamoDB can only project whole attributes; the blob is one attribute
+TRANSACTION_PROJECTION = 'SORT_KEY, processed_transaction'
+
+# List types with their own `EVALUATED-<LIST>` partition
+LIST_TYPES = ('BLACKLIST', 'WATCHLIST', 'STAFFLIST', 'UNLIST', 'WBLIST')
+
+_local = threading.local()
+_DECODER = json.JSONDecoder()
+
+
+def thread_table():
+    """boto3 resources are not thread-safe, so each worker thread gets its own Table"""
+    table = getattr(_local, 'table', None)
+    if table is None:
+        table = InstrumentedTable(boto3.session.Session().resource('dynamodb').Table(TABLE_NAME))
+        _local.table = table
+    return table
+
+
+def sort_key_timestamp(sort_key):
+    """Epoch seconds encoded in a `{timestamp}_{uuid}` sort key"""
+    return int(sort_key.split('_', 1)[0])
+
+
+def iter_items(partition_key, start_timestamp, end_timestamp, projection=TRANSACTION_PROJECTION, newest_first=False):
+    """Yield the items of *partition_key* between the two epoch bounds, one page at a time"""
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').between(f"{start_timestamp}_", f"{end_timestamp}_z"),
+        'ProjectionExpression': projection,
+        'ScanIndexForward': not newest_first,
+    }
+    while True:
+        response = thread_table().query(**query_kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def csv_param(params, name, allowed, default, upper=False):
+    """
+    Comma-separated parameter -> tuple of values from *allowed* (any value
+    when None); *default* when absent
+    """
+    raw = params.get(name, '')
+    values = tuple(v.strip() for v in (raw.upper() if upper else raw).split(',') if v.strip()) or default
+    unknown = [v for v in values if allowed is not None and v not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown {name}: {', '.join(unknown)}")
+    return values
+
+
+def list_types_param(params):
+    """`list_type=blacklist,watchlist` -> ('BLACKLIST', 'WATCHLIST'); all list types when absent"""
+    return csv_param(params, 'list_type', LIST_TYPES, LIST_TYPES, upper=True)
+
+
+def split_range(start_timestamp, end_timestamp, slices):
+    """Split the inclusive range into at most *slices* contiguous, non-overlapping sub-ranges"""
+    span = end_timestamp - start_timestamp + 1
+    slices = max(1, min(slices, span))
+    step = -(-span // slices)
+    return [
+        (lower, min(lower + step - 1, end_timestamp))
+        for lower in range(start_timestamp, end_timestamp + 1, step)
+    ]
+
+
+def map_tasks(worker, tasks):
+    """Call `worker(*task)` for every task tuple, in parallel, and return the results in order"""
+    tasks = list(tasks)
+    if len(tasks) <= 1:
+        return [worker(*task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(tasks))) as pool:
+        return list(pool.map(lambda task: worker(*task), tasks))
+
+
+def map_ranges(worker, partition_keys, start_timestamp, end_timestamp, slices=DEFAULT_SLICES):
+    """
+    Call `worker(partition_key, start, end)` for every partition and time
+    slice, in parallel, and return the list of partial results.
+    """
+    return map_tasks(worker, [
+        (partition_key, lower, upper)
+        for partition_key in partition_keys
+        for lower, upper in split_range(start_timestamp, end_timestamp, slices)
+    ])
+
+
+def extract_field(blob, name, default=None):
+    """
+    Decode the top-level *name* field of a `processed_transaction` blob.
+
+    The blob is written by `json.dumps`, so the field appears as `"name": `;
+    only that value is parsed (`raw_decode`), the rest of the string is
+    skipped.  Returns *default* when the field is absent.
+    """
+    marker = f'"{name}":'
+    index = blob.find(marker)
+    if index < 0:
+        return default
+    index += len(marker)
+    while blob[index] in ' \t\r\n':
+        index += 1
+    value, _ = _DECODER.raw_decode(blob, index)
+    return value
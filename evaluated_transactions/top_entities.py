@@ -0,0 +1,220 @@
+"""
+GET /evaluated-transactions/top
+
+Top-N accounts / processors / merchants / products by flagged amount or
+count, read from the `EVALUATED-<LIST>` partitions (only flagged
+transactions are written there).
+
+  - `mode=exact`    one compact `{entity: [count, amount]}` dict per time
+                    slice, merged and ranked with `heapq.nlargest`; memory
+                    grows with the number of distinct entities
+  - `mode=approx`   a weighted space-saving summary of SPACE_SAVING_FACTOR * N
+                    counters per slice, merged the same way; memory is fixed
+                    whatever the cardinality.  The ranked metric is reported
+                    as its space-saving upper bound with an `error`; without
+                    sampling the true value is within `[value - error,
+                    value]`.  `sample=<rate>` additionally decodes only that
+                    fraction of transactions (chosen by sort key hash) and
+                    scales the totals back up; the bound then describes the
+                    scaled sample, not the true total.
+"""
+import heapq
+import zlib
+
+from streaming import iter_items, map_ranges, extract_field, list_types_param
+from perf import note_query
+
+# Request value -> (`original_transaction` fields forming the entity, response fields)
+ENTITY_KEYS = {
+    'account': (('account_id',), ('account_ref',)),
+    'processor': (('application_id',), ('processor',)),
+    'merchant': (('application_id', 'merchant_id'), ('processor', 'merchant_id')),
+    'product': (('application_id', 'merchant_id', 'product_id'), ('processor', 'merchant_id', 'product_id')),
+}
+METRICS = ('amount', 'count')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SPACE_SAVING_FACTOR = 10
+
+
+class SpaceSaving:
+    """
+    Weighted space-saving summary (Metwally et al.) with a fixed number of
+    counters.  A new key replaces the smallest counter and inherits its
+    weight as `error`, so for the weights added a key's `weight` is an upper
+    bound on its total and `weight - error` (what was added while it held a
+    counter) a lower bound.  `count` and `amount` are only that lower part.
+    `merge()` keeps both bounds; weights scaled up from a sample are
+    estimates, and then no bound holds for the true total.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}  # key -> [weight, error, count, amount]
+        self.heap = []      # (weight, key), stale entries skipped lazily
+        self.untracked = 0.0  # most an untracked key can weigh below capacity (after merges)
+
+    def minimum(self):
+        """Most an untracked key can weigh: the smallest counter once full"""
+        if len(self.counters) < self.capacity:
+            return self.untracked
+        while True:
+            weight, key = self.heap[0]
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == weight:
+                return weight
+            heapq.heappop(self.heap)
+
+    def add(self, key, weight, count=1, amount=0.0, error=0.0):
+        counter = self.counters.get(key)
+        if counter is None:
+            floor = self.minimum()
+            if len(self.counters) >= self.capacity:
+                _, evicted = heapq.heappop(self.heap)
+                del self.counters[evicted]
+            error += floor
+            weight += floor
+            counter = self.counters[key] = [0.0, error, 0, 0.0]
+        else:
+            counter[1] += error
+        counter[0] += weight
+        counter[2] += count
+        counter[3] += amount
+        heapq.heappush(self.heap, (counter[0], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c[0], k) for k, c in self.counters.items()]
+            heapq.heapify(self.heap)
+
+    def merge(self, other):
+        """
+        Fold in *other* (Agarwal et al., mergeable summaries): a key missing
+        from one summary may have had up to that summary's smallest weight
+        there, which is added to its weight and its error
+        """
+        floors = (self.minimum(), other.minimum())
+        combined = {}
+        for key in set(self.counters) | set(other.counters):
+            sides = [
+                summary.counters.get(key, [floor, floor, 0, 0.0])
+                for summary, floor in zip((self, other), floors)
+            ]
+            combined[key] = [a + b for a, b in zip(*sides)]
+        # Every dropped key weighs no more than the smallest one kept, and a
+        # key in neither summary no more than the two floors
+        self.untracked = sum(floors)
+        self.counters = dict(heapq.nlargest(self.capacity, combined.items(), key=lambda entry: entry[1][0]))
+        self.heap = [(counter[0], key) for key, counter in self.counters.items()]
+        heapq.heapify(self.heap)
+
+    def top(self, n):
+        return heapq.nlargest(n, self.counters.items(), key=lambda entry: entry[1][0])
+
+
+def sampled(sort_key, rate):
+    """Deterministic per-transaction sampling on the sort key's uuid"""
+    return zlib.crc32(sort_key.encode()) < rate * 0x100000000
+
+
+def handle(params, start_timestamp, end_timestamp):
+    """Return `(data, metadata)`; invalid parameters raise ValueError"""
+    entity = params.get('entity', 'account').lower()
+    if entity not in ENTITY_KEYS:
+        raise ValueError(f"entity must be one of {', '.join(ENTITY_KEYS)}")
+    metric = params.get('metric', 'amount').lower()
+    if metric not in METRICS:
+        raise ValueError('metric must be amount or count')
+    mode = params.get('mode', 'exact').lower()
+    if mode not in ('exact', 'approx'):
+        raise ValueError('mode must be exact or approx')
+    limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    rate = float(params.get('sample', 1)) if mode == 'approx' else 1.0
+    if not 0 < rate <= 1:
+        raise ValueError('sample must be in (0, 1]')
+    channel = params.get('channel', '')
+    fields, response_fields = ENTITY_KEYS[entity]
+    partition_keys = [f"EVALUATED-{list_type}" for list_type in list_types_param(params)]
+
+    def entity_key(original_transaction):
+        return '__'.join(str(original_transaction.get(field, '')) for field in fields)
+
+    def exact_worker(partition_key, lower, upper):
+        totals = {}
+        for item in iter_items(partition_key, lower, upper):
+            original_transaction = extract_field(item['processed_transaction'], 'original_transaction', {})
+            if channel and original_transaction.get('channel') != channel:
+                continue
+            key = entity_key(original_transaction)
+            amount = float(original_transaction.get('amount') or 0)
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [1, amount]
+            else:
+                total[0] += 1
+                total[1] += amount
+        return totals
+
+    def approx_worker(partition_key, lower, upper):
+        summary = SpaceSaving(limit * SPACE_SAVING_FACTOR)
+        for item in iter_items(partition_key, lower, upper):
+            if rate < 1 and not sampled(item['SORT_KEY'], rate):
+                continue
+            original_transaction = extract_field(item['processed_transaction'], 'original_transaction', {})
+            if channel and original_transaction.get('channel') != channel:
+                continue
+            amount = float(original_transaction.get('amount') or 0) / rate
+            summary.add(entity_key(original_transaction),
+                        amount if metric == 'amount' else 1 / rate,
+                        1 / rate,
+                        amount)
+        return summary
+
+    worker = exact_worker if mode == 'exact' else approx_worker
+    partials = map_ranges(worker, partition_keys, start_timestamp, end_timestamp)
+    note_query(partitions=partition_keys)
+
+    if mode == 'exact':
+        totals = {}
+        for partial in partials:
+            for key, (count, amount) in partial.items():
+                total = totals.setdefault(key, [0, 0.0])
+                total[0] += count
+                total[1] += amount
+        rank_index = 1 if metric == 'amount' else 0
+        ranked = [
+            (key, count, amount, None)
+            for key, (count, amount) in heapq.nlargest(
+                limit, totals.items(), key=lambda entry: entry[1][rank_index])
+        ]
+        summary_size = len(totals)
+    else:
+        merged = SpaceSaving(limit * SPACE_SAVING_FACTOR)
+        for partial in partials:
+            merged.merge(partial)
+        # The ranked metric is reported as its upper bound, `error` below it
+        ranked = [
+            (key, weight if metric == 'count' else count, weight if metric == 'amount' else amount, error)
+            for key, (weight, error, count, amount) in merged.top(limit)
+        ]
+        summary_size = len(merged.counters)
+
+    data = []
+    for rank, (key, count, amount, error) in enumerate(ranked, start=1):
+        row = {'rank': rank}
+        row.update(zip(response_fields, key.split('__')))
+        row['count'] = round(count) if mode == 'approx' else count
+        row['amount'] = round(amount, 2)
+        if error is not None:
+            row['error'] = round(error, 2)
+        data.append(row)
+    note_query(rows=len(data))
+
+    metadata = {
+        'entity': entity,
+        'metric': metric,
+        'mode': mode,
+        'sample': rate,
+        'list_types': [partition_key.split('-', 1)[1] for partition_key in partition_keys],
+        'tracked_entities': summary_size,
+    }
+    return data, metadata
@@ -4,6 +4,7 @@ from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -156,6 +157,7 @@ def lambda_handler(event, context):
         )
 
         print("The response after putting 1st item in DB is ", response_db)
+        bump_list_version(table, partition_key)
 
         #Adding additional data item
         response_db_2 = table.put_item(
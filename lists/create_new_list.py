@@ -4,6 +4,7 @@ from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -101,6 +102,7 @@ def create_list_type(list_type_data):
         
         # Create the list type
         table.put_item(Item=item)
+        bump_list_version(table, LIST_TYPE_DEFINITION_PK)
         
         return True, item
     
@@ -3,6 +3,7 @@ import boto3
 from botocore.exceptions import ClientError
 import os
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -75,6 +76,7 @@ def lambda_handler(event, context):
         )
 
         print("The response after deleting item from DB is ", response_db)
+        bump_list_version(table, partition_key)
 
         return response(200, {'message': 'Item deleted successfully'})
     except ClientError as e:
@@ -3,6 +3,7 @@ import boto3
 from botocore.exceptions import ClientError
 import os
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -81,6 +82,7 @@ def delete_all_list_entries(list_type):
         
         # Delete items in batches
         deleted_count = 0
+        touched_partitions = set()
         if items_to_delete:
             with table.batch_writer() as batch:
                 for item in items_to_delete:
@@ -91,6 +93,10 @@ def delete_all_list_entries(list_type):
                         }
                     )
                     deleted_count += 1
+                    touched_partitions.add(item['PARTITION_KEY'])
+        
+        for partition_key in touched_partitions:
+            bump_list_version(table, partition_key)
         
         return deleted_count
     
@@ -138,6 +144,7 @@ def delete_list_type(list_type, force_delete=False):
                 'SORT_KEY': list_type
             }
         )
+        bump_list_version(table, LIST_TYPE_DEFINITION_PK)
         
         return True, {
             'message': f"List type '{list_type}' deleted successfully",
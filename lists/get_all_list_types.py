@@ -4,10 +4,13 @@ from botocore.exceptions import ClientError
 import os
 from decimal import Decimal
 import math
+from http_cache import compute_etag, if_none_match, not_modified, with_etag
+from list_versions import list_versions
+from perf import InstrumentedTable, instrumented_handler, debug_metadata
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
-table = dynamodb.Table(table_name)
+table = InstrumentedTable(dynamodb.Table(table_name))
 
 PAGE_SIZE = 20
 
@@ -127,6 +130,7 @@ def get_all_list_types():
         print(f"Error getting all list types: {str(e)}")
         raise e
 
+@instrumented_handler('ListTypes')
 def lambda_handler(event, context):
     try:
         print("The event is ", event)
@@ -140,6 +144,11 @@ def lambda_handler(event, context):
         is_active = query_params.get('is_active')
         category = query_params.get('category')
         
+        # Conditional GET on the LIST_TYPE_DEFINITIONS version marker
+        etag = compute_etag(query_params, list_versions(table, LIST_TYPE_DEFINITION_PK))
+        if if_none_match(event, etag):
+            return not_modified(etag)
+        
         # Get all list types
         items = get_all_list_types()
         
@@ -152,7 +161,8 @@ def lambda_handler(event, context):
             items = [item for item in items if item['category'].upper() == category.upper()]
         
         result = format_response(items, page, page_size)
-        return response(200, result)
+        result['metadata'].update(debug_metadata())
+        return with_etag(response(200, result), etag)
 
     except ClientError as e:
         print("A ClientError occurred ", e)
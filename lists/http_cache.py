@@ -0,0 +1,73 @@
+"""
+ETag / conditional GET helpers.
+
+Handlers compute a strong ETag from something cheap (a version marker, or
+the canonical query itself) *before* reading the data.  When the client's
+`If-None-Match` matches, a bodyless `304 Not Modified` is returned and the
+expensive read is skipped entirely; otherwise the ETag is attached to the
+normal `200` so the next request can be conditional.
+"""
+import hashlib
+import json
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Credentials': True,
+}
+
+# Mutable data (lists, merchants): cache, but always revalidate
+REVALIDATE = 'no-cache'
+
+
+def compute_etag(*parts):
+    """Strong ETag over the JSON encoding of *parts* (order-sensitive)"""
+    digest = hashlib.sha1(
+        json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str).encode()
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def request_header(event, name):
+    """Case-insensitive header lookup on an API Gateway proxy event"""
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def if_none_match(event, etag):
+    """True when the request's If-None-Match covers *etag* (`*`, lists and W/ allowed)"""
+    header = request_header(event, 'If-None-Match')
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag, cache_control=REVALIDATE):
+    headers = dict(CORS_HEADERS)
+    headers['ETag'] = etag
+    headers['Cache-Control'] = cache_control
+    return {
+        'statusCode': 304,
+        'body': '',
+        'headers': headers,
+    }
+
+
+def with_etag(result, etag, cache_control=REVALIDATE):
+    """Attach validators to a successful response; errors are left uncached"""
+    if result.get('statusCode') == 200:
+        headers = result.setdefault('headers', {})
+        headers['ETag'] = etag
+        headers['Cache-Control'] = cache_control
+    return result
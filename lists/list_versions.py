@@ -0,0 +1,68 @@
+"""
+Per-partition version markers for FRAUD_LISTS_TABLE.
+
+Every writer bumps a small counter item after it changes a list partition:
+
+    PARTITION_KEY = "LIST_VERSION"
+    SORT_KEY      = <list partition key>   e.g. "BLACKLIST-card-ACCOUNT",
+                                                "LIST_TYPE_DEFINITIONS"
+    version       = N (atomic ADD)
+
+Read handlers hash the relevant markers into an ETag instead of re-reading
+the list entries, so an unchanged list is answered with a 304 for the cost
+of one GetItem (or one small Query over the marker partition for the
+scan-based endpoints).
+"""
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key
+
+VERSION_PARTITION_KEY = "LIST_VERSION"
+
+
+def bump_list_version(table, partition_key):
+    """
+    Increment the marker for *partition_key*.  Errors are raised: a list
+    change without a bump would keep being answered with 304 from the old
+    ETag, so the caller has to report the write as failed.
+    """
+    table.update_item(
+        Key={
+            'PARTITION_KEY': VERSION_PARTITION_KEY,
+            'SORT_KEY': partition_key
+        },
+        UpdateExpression="ADD version :one SET updated_at = :now",
+        ExpressionAttributeValues={
+            ':one': 1,
+            ':now': str(datetime.now())
+        }
+    )
+
+
+def list_versions(table, partition_key=None):
+    """
+    Return `{partition_key: version}` for one marker, or for every marker
+    when *partition_key* is None.  Missing markers read as version 0.
+    """
+    if partition_key is not None:
+        item = table.get_item(
+            Key={
+                'PARTITION_KEY': VERSION_PARTITION_KEY,
+                'SORT_KEY': partition_key
+            },
+            ProjectionExpression="version"
+        ).get('Item') or {}
+        return {partition_key: int(item.get('version', 0))}
+
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(VERSION_PARTITION_KEY),
+        'ProjectionExpression': "SORT_KEY, version",
+    }
+    versions = {}
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response.get('Items', []):
+            versions[item['SORT_KEY']] = int(item.get('version', 0))
+        if 'LastEvaluatedKey' not in response:
+            return versions
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
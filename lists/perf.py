@@ -0,0 +1,292 @@
+"""
+Per-request DynamoDB cost and latency accounting.
+
+Wrap the module-level table once:
+
+    table = InstrumentedTable(dynamodb.Table(...))
+
+and decorate the handler:
+
+    @instrumented_handler("EvaluatedTransactions")
+    def lambda_handler(event, context): ...
+
+Every query / scan / get / put / update / delete made through the wrapper
+asks for `ReturnConsumedCapacity=TOTAL` and is timed.  When the handler
+returns, the per-request totals are printed as one CloudWatch Embedded
+Metric Format (EMF) line, which CloudWatch turns into metrics without any
+API calls.  With `debug=true` in the query string the same totals can be
+attached to the response as `metadata._perf` via `debug_metadata()`.
+
+Slow-query log: handlers mark their CPU phases with `phase('decode')`,
+`phase('enrich')` and `phase('serialize')` and report what they read with
+`note_query()`.  A request slower than SLOW_QUERY_MS or scanning more than
+SLOW_QUERY_SCANNED items always logs a `slow_query` record; healthy
+requests are logged for a SLOW_QUERY_SAMPLE_RATE fraction only, so the log
+stays cheap until something degrades.
+
+Phases and DynamoDB calls on worker threads (`streaming.map_tasks`) overlap
+in time, so they are kept apart from the handler thread's: the time split
+adds up to the request time, and the worker totals are reported separately
+as summed worker time.  `DynamoTime` is the sum over every call, parallel
+ones included.
+"""
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+NAMESPACE = os.environ.get('PERF_METRICS_NAMESPACE', 'FraudDashboardApi')
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 1000))
+SLOW_QUERY_SCANNED = int(os.environ.get('SLOW_QUERY_SCANNED', 1000))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.01))
+
+# Parameters that describe the shape of a query; any other value (ids, dates,
+# tokens) is logged as "?" so that records group by query shape
+SHAPE_PARAMS = {
+    'query_type', 'channel', 'list_type', 'entity_type', 'format', 'view',
+    'enrich', 'debug', 'page_size', 'per_page', 'limit', 'wait', 'window',
+    'status', 'is_active', 'category', 'level', 'period',
+    'interval', 'lists', 'entity', 'metric', 'mode', 'sample',
+    'fields', 'by', 'q', 'currency',
+}
+
+INSTRUMENTED_OPERATIONS = ('query', 'scan', 'get_item', 'put_item', 'update_item', 'delete_item')
+
+
+class RequestStats:
+    """Counters for the request being handled; safe to update from worker threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, route='', debug=False):
+        with self.lock:
+            self.thread = threading.get_ident()
+            self.route = route
+            self.debug = debug
+            self.started = time.perf_counter()
+            self.calls = 0
+            self.items_scanned = 0
+            self.items_returned = 0
+            self.capacity_units = 0.0
+            self.dynamo_ms = 0.0
+            self.worker_dynamo_ms = 0.0
+            self.operations = {}
+            self.phases = {}
+            self.worker_phases = {}
+            self.partitions = []
+            self.rows = None
+
+    def record(self, operation, elapsed_ms, response):
+        response = response or {}
+        if 'Items' in response:
+            returned = response.get('Count', len(response['Items']))
+            scanned = response.get('ScannedCount', returned)
+        elif 'Count' in response:
+            # Select=COUNT
+            returned = response['Count']
+            scanned = response.get('ScannedCount', returned)
+        else:
+            returned = scanned = 1 if 'Item' in response else 0
+        capacity = float((response.get('ConsumedCapacity') or {}).get('CapacityUnits', 0))
+
+        THREAD_TIMES.dynamo_ms = getattr(THREAD_TIMES, 'dynamo_ms', 0.0) + elapsed_ms
+        with self.lock:
+            self.calls += 1
+            self.items_scanned += scanned
+            self.items_returned += returned
+            self.capacity_units += capacity
+            self.dynamo_ms += elapsed_ms
+            if threading.get_ident() != self.thread:
+                self.worker_dynamo_ms += elapsed_ms
+            totals = self.operations.setdefault(operation, {'calls': 0, 'ms': 0.0})
+            totals['calls'] += 1
+            totals['ms'] += elapsed_ms
+
+    def add_phase(self, name, elapsed_ms):
+        with self.lock:
+            # Worker threads run in parallel: their phase times are summed
+            # work, not part of the request's wall time
+            phases = self.phases if threading.get_ident() == self.thread else self.worker_phases
+            phases[name] = phases.get(name, 0.0) + elapsed_ms
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'route': self.route,
+                'dynamo_calls': self.calls,
+                'items_scanned': self.items_scanned,
+                'items_returned': self.items_returned,
+                'consumed_capacity_units': round(self.capacity_units, 2),
+                'dynamo_ms': round(self.dynamo_ms, 1),
+                'request_ms': round((time.perf_counter() - self.started) * 1000, 1),
+                'operations': {
+                    name: {'calls': totals['calls'], 'ms': round(totals['ms'], 1)}
+                    for name, totals in self.operations.items()
+                },
+                'phases_ms': {name: round(ms, 1) for name, ms in self.phases.items()},
+                'worker_dynamo_ms': round(self.worker_dynamo_ms, 1),
+                'worker_phases_ms': {name: round(ms, 1) for name, ms in self.worker_phases.items()},
+            }
+
+
+STATS = RequestStats()
+
+# DynamoDB milliseconds of the current thread, so that a phase only excludes
+# its own thread's calls
+THREAD_TIMES = threading.local()
+
+
+class InstrumentedTable:
+    """Drop-in proxy for a boto3 `Table` that meters the data-plane calls"""
+
+    def __init__(self, table, stats=STATS):
+        self._table = table
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attribute = getattr(self._table, name)
+        if name not in INSTRUMENTED_OPERATIONS:
+            return attribute
+
+        def call(**kwargs):
+            kwargs.setdefault('ReturnConsumedCapacity', 'TOTAL')
+            started = time.perf_counter()
+            response = None
+            try:
+                response = attribute(**kwargs)
+                return response
+            finally:
+                self._stats.record(name, (time.perf_counter() - started) * 1000, response)
+
+        return call
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a CPU phase (`decode`, `enrich`, `serialize`).  DynamoDB time spent
+    inside the block on the same thread is excluded because it is already
+    counted as `dynamo`.
+    """
+    started = time.perf_counter()
+    dynamo_before = getattr(THREAD_TIMES, 'dynamo_ms', 0.0)
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        dynamo_ms = getattr(THREAD_TIMES, 'dynamo_ms', 0.0) - dynamo_before
+        STATS.add_phase(name, elapsed_ms - dynamo_ms)
+
+
+def note_query(partitions=None, rows=None):
+    """Record the partition(s) read and/or the number of rows returned"""
+    with STATS.lock:
+        if partitions:
+            STATS.partitions.extend(p for p in partitions if p not in STATS.partitions)
+        if rows is not None:
+            STATS.rows = rows
+
+
+def normalize_params(params):
+    return {
+        name: (value if name in SHAPE_PARAMS else '?')
+        for name, value in sorted((params or {}).items())
+    }
+
+
+def log_slow_query(function_name, params):
+    """Always log slow requests; log a sample of the healthy ones"""
+    snapshot = STATS.snapshot()
+    slow = (snapshot['request_ms'] >= SLOW_QUERY_MS
+            or snapshot['items_scanned'] >= SLOW_QUERY_SCANNED)
+    if not slow and random.random() >= SLOW_QUERY_SAMPLE_RATE:
+        return
+
+    rows = STATS.rows if STATS.rows is not None else snapshot['items_returned']
+    # Handler thread only, so the split adds up to request_ms; time spent
+    # waiting on worker threads falls under `other`
+    split = {'dynamo': round(snapshot['dynamo_ms'] - snapshot['worker_dynamo_ms'], 1)}
+    for name in ('decode', 'enrich', 'serialize'):
+        split[name] = snapshot['phases_ms'].get(name, 0.0)
+    split['other'] = round(max(snapshot['request_ms'] - sum(split.values()), 0.0), 1)
+    workers = {'dynamo': snapshot['worker_dynamo_ms'], **snapshot['worker_phases_ms']}
+
+    print(json.dumps({
+        'slow_query': slow,
+        'function': function_name,
+        'route': snapshot['route'],
+        'params': normalize_params(params),
+        'partitions': list(STATS.partitions),
+        'pages_fetched': sum(
+            snapshot['operations'].get(name, {}).get('calls', 0) for name in ('query', 'scan')
+        ),
+        'items_scanned': snapshot['items_scanned'],
+        'items_returned': rows,
+        'amplification': round(snapshot['items_scanned'] / max(rows, 1), 2),
+        'request_ms': snapshot['request_ms'],
+        'time_split_ms': split,
+        'worker_time_summed_ms': workers if any(workers.values()) else None,
+    }, default=str))
+
+
+def debug_metadata():
+    """`{'_perf': {...}}` when the current request asked for debug=true, else {}"""
+    return {'_perf': STATS.snapshot()} if STATS.debug else {}
+
+
+def emit_metrics(function_name):
+    """Print the request totals as a CloudWatch Embedded Metric Format line"""
+    snapshot = STATS.snapshot()
+    metrics = (
+        ('DynamoCalls', 'dynamo_calls', 'Count'),
+        ('ItemsScanned', 'items_scanned', 'Count'),
+        ('ItemsReturned', 'items_returned', 'Count'),
+        ('ConsumedCapacityUnits', 'consumed_capacity_units', 'None'),
+        ('DynamoTime', 'dynamo_ms', 'Milliseconds'),
+        ('RequestTime', 'request_ms', 'Milliseconds'),
+    )
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Function', 'Route']],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, _, unit in metrics],
+            }],
+        },
+        'Function': function_name,
+        'Route': snapshot['route'],
+        'operations': snapshot['operations'],
+    }
+    for name, key, _ in metrics:
+        record[name] = snapshot[key]
+    print(json.dumps(record))
+
+
+def instrumented_handler(function_name):
+    """Reset the counters per invocation; emit the EMF line and slow-query record when it returns"""
+
+    def decorate(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            event = event or {}
+            params = event.get('queryStringParameters') or {}
+            STATS.reset(
+                route=event.get('path') or event.get('resource') or '',
+                debug=str(params.get('debug', '')).lower() == 'true',
+            )
+            try:
+                return handler(event, context)
+            finally:
+                emit_metrics(function_name)
+                log_slow_query(function_name, params)
+
+        return wrapper
+
+    return decorate
@@ -4,11 +4,16 @@ from botocore.exceptions import ClientError
 from datetime import datetime
 import os
 from boto3.dynamodb.conditions import Key, Attr
+from response_encoding import FORMATS, make_writer
+from http_cache import compute_etag, if_none_match, not_modified, with_etag
+from list_versions import list_versions
+from perf import InstrumentedTable, instrumented_handler, debug_metadata, note_query, phase
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
-table = dynamodb.Table(table_name)
+table = InstrumentedTable(dynamodb.Table(table_name))
 
+@instrumented_handler('ListsRead')
 def lambda_handler(event, context):
     try:
         print("The event is ", event)
@@ -19,30 +24,51 @@ def lambda_handler(event, context):
         if method != 'GET':
             return response(400, "Only GET method is supported")
 
-        if path == '/lists':
-            return handle_specific_query(event)
-        elif path == '/lists/by-list-type':
-            return handle_list_type_query(event)
-        elif path == '/lists/by-channel':
-            return handle_channel_query(event)
-        elif path == '/lists/by-entity-type':
-            return handle_entity_type_query(event)
-        elif path == '/lists/by-date-range':
-            return handle_date_range_query(event)
-        elif path == '/lists/by-list-type-and-entity-type':
-            return handle_list_type_and_entity_type_query(event)
-        else:
+        params = event['queryStringParameters'] or {}
+        if params.get('format', 'rows') not in FORMATS:
+            return response(400, f"format must be one of {', '.join(FORMATS)}")
+
+        handlers = {
+            '/lists': handle_specific_query,
+            '/lists/by-list-type': handle_list_type_query,
+            '/lists/by-channel': handle_channel_query,
+            '/lists/by-entity-type': handle_entity_type_query,
+            '/lists/by-date-range': handle_date_range_query,
+            '/lists/by-list-type-and-entity-type': handle_list_type_and_entity_type_query,
+        }
+        if path not in handlers:
             return response(404, "Not Found")
 
+        # Conditional GET: the version markers stand in for the list contents
+        scope = version_scope(path, params)
+        note_query(partitions=[scope or "TABLE_SCAN"])
+        etag = compute_etag(path, params, list_versions(table, scope))
+        if if_none_match(event, etag):
+            return not_modified(etag)
+        return with_etag(handlers[path](event), etag)
+
     except Exception as e:
         print("An error occured ", e)
         return response(500, {"message": f"Error: {str(e)}"})
 
+def version_scope(path, params):
+    """
+    The single list partition a request reads, or None when it scans across
+    partitions (in which case every version marker feeds the ETag).
+    """
+    list_type = params.get('list_type')
+    channel = params.get('channel')
+    entity_type = params.get('entity_type')
+    if path == '/lists' and list_type and channel and entity_type:
+        return f"{list_type}-{channel.lower()}-{entity_type}"
+    return None
+
 def handle_specific_query(event):
     params = event['queryStringParameters'] or {}
     print("The params are ", params)
-    if params == {}:
-        return response(200, query_items_in_all_lists_sorted_by_date())
+    fmt = params.get('format', 'rows')
+    if not any(key != 'format' for key in params):
+        return response(200, query_items_in_all_lists_sorted_by_date(), fmt)
     list_type = params.get('list_type')
     channel = params.get('channel')
     if channel is not None:
@@ -75,7 +101,7 @@ def handle_specific_query(event):
         return response(400, "Missing required parameters")
 
     items = query_specific(list_type, channel, entity_type, entity_id)
-    return response(200, items)
+    return response(200, items, fmt)
 
 
 def handle_list_type_query(event):
@@ -86,7 +112,7 @@ def handle_list_type_query(event):
         return response(400, "List type is required")
 
     items = query_by_list_type(list_type)
-    return response(200, transform_items(items))
+    return response(200, transform_items(items), params.get('format', 'rows'))
 
 def handle_channel_query(event):
     params = event['queryStringParameters'] or {}
@@ -97,7 +123,7 @@ def handle_channel_query(event):
         return response(400, "Channel is required")
 
     items = query_by_channel(channel, entity_type)
-    return response(200, transform_items(items))
+    return response(200, transform_items(items), params.get('format', 'rows'))
 
 def handle_entity_type_query(event):
     params = event['queryStringParameters'] or {}
@@ -107,7 +133,7 @@ def handle_entity_type_query(event):
         return response(400, "Entity type is required")
 
     items = query_by_entity_type(entity_type)
-    return response(200, transform_items(items))
+    return response(200, transform_items(items), params.get('format', 'rows'))
 
 def handle_list_type_and_entity_type_query(event):
     params = event['queryStringParameters'] or {}
@@ -118,7 +144,7 @@ def handle_list_type_and_entity_type_query(event):
         return response(400, "Both entity type and list type are required")
     
     items = query_by_list_and_entity_type(list_type, entity_type)
-    return response(200, items)
+    return response(200, items, params.get('format', 'rows'))
 
 def handle_date_range_query(event):
     params = event['queryStringParameters'] or {}
@@ -136,7 +162,7 @@ def handle_date_range_query(event):
         end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
         
         items = query_by_date_range(start, end)
-        return response(200, items)
+        return response(200, items, params.get('format', 'rows'))
     except ValueError as e:
         return response(400, f"Invalid date format. Use YYYY-MM-DD: {str(e)}")
 
@@ -319,16 +345,31 @@ def transform_items(items):
     return transformed_items
 
 
-def response(status_code, body):
+def response(status_code, body, fmt='rows'):
+    if isinstance(body, list):
+        note_query(rows=len(body))
+    if fmt != 'rows' and isinstance(body, list):
+        # Columnar / MessagePack output: stream the items into the writer
+        writer = make_writer(fmt)
+        for item in body:
+            writer.add_mapping(item)
+        with phase('serialize'):
+            return writer.render(status_code, debug_metadata() or None)
+
     response_message = "Operation Successful" if status_code == 200 else "Unsuccessful operation"
     body_to_send = {
         "responseCode": status_code,
         "responseMessage": response_message,
         "data": body
     }
+    perf_metadata = debug_metadata()
+    if perf_metadata:
+        body_to_send["metadata"] = perf_metadata
+    with phase('serialize'):
+        body_json = json.dumps(body_to_send)
     return {
         'statusCode': status_code,
-        'body': json.dumps(body_to_send),
+        'body': body_json,
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
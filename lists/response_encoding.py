@@ -0,0 +1,171 @@
+"""
+Response writers for the `format=` query parameter.
+
+Mirrors `evaluated_transactions/response_encoding.py` (each Lambda is
+packaged from its own folder):
+
+  - RowsWriter      `format=rows`    – the classic list of item objects
+  - ColumnsWriter   `format=columns` – one array per attribute plus `row_count`
+  - MsgpackWriter   `format=msgpack` – the columnar layout, MessagePack
+                                       encoded and base64 wrapped
+
+List items are heterogeneous, so they are fed with `add_mapping()`; a column
+appearing part-way through a page is back-filled with null for earlier rows.
+"""
+import base64
+import json
+from decimal import Decimal
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for format=msgpack
+    msgpack = None
+
+FORMATS = ('rows', 'columns', 'msgpack')
+
+MSGPACK_HEADERS = {
+    'Content-Type': 'application/x-msgpack',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Credentials': True,
+}
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Credentials': True,
+}
+
+
+def decimal_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def envelope(status_code, data, metadata):
+    response_message = "Operation Successful" if status_code == 200 else "Unsuccessful operation"
+    return {
+        "responseCode": status_code,
+        "responseMessage": response_message,
+        "data": data,
+        "metadata": metadata,
+    }
+
+
+class RowsWriter:
+    """Default format: a list of `{column: value}` objects"""
+
+    def __init__(self, columns=()):
+        self.columns = tuple(columns)
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, values):
+        self.rows.append(dict(zip(self.columns, values)))
+
+    def add_mapping(self, row):
+        self.rows.append(row)
+
+    def render(self, status_code, metadata):
+        return {
+            'statusCode': status_code,
+            'body': json.dumps(envelope(status_code, self.rows, metadata), default=decimal_default),
+            'headers': dict(JSON_HEADERS),
+        }
+
+
+class ColumnsWriter:
+    """
+    Columnar format: `{"row_count": n, "columns": {name: [v0, v1, ...]}}`.
+
+    Rows are appended value-by-value into per-column arrays.  Mapping rows
+    (used for heterogeneous items) may introduce new columns part-way through
+    a page; earlier rows are back-filled with null so every array keeps
+    `row_count` entries.
+    """
+
+    def __init__(self, columns=()):
+        self.names = list(columns)
+        self.data = [[] for _ in self.names]
+        self.positions = {name: index for index, name in enumerate(self.names)}
+        self.row_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    def add(self, values):
+        for column, value in zip(self.data, values):
+            column.append(value)
+        self.row_count += 1
+
+    def add_mapping(self, row):
+        for name, value in row.items():
+            if name not in self.positions:
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+                self.data.append([None] * self.row_count)
+            self.data[self.positions[name]].append(value)
+        self.row_count += 1
+        for column in self.data:
+            if len(column) < self.row_count:
+                column.append(None)
+
+    def payload(self):
+        return {
+            'row_count': self.row_count,
+            'columns': dict(zip(self.names, self.data)),
+        }
+
+    def render(self, status_code, metadata):
+        return {
+            'statusCode': status_code,
+            'body': json.dumps(envelope(status_code, self.payload(), metadata), default=decimal_default),
+            'headers': dict(JSON_HEADERS),
+        }
+
+
+class MsgpackWriter(ColumnsWriter):
+    """
+    Columnar layout encoded with MessagePack and base64-wrapped for API
+    Gateway.  The envelope is packed incrementally – one column at a time –
+    rather than building a second copy of the page as a Python dict.
+    """
+
+    def render(self, status_code, metadata):
+        packer = msgpack.Packer(default=decimal_default)
+        message = envelope(status_code, None, metadata)
+        parts = [packer.pack_map_header(len(message))]
+        for key, value in message.items():
+            parts.append(packer.pack(key))
+            if key != 'data':
+                parts.append(packer.pack(value))
+                continue
+            parts.append(packer.pack_map_header(2))
+            parts.append(packer.pack('row_count'))
+            parts.append(packer.pack(self.row_count))
+            parts.append(packer.pack('columns'))
+            parts.append(packer.pack_map_header(len(self.names)))
+            for name, column in zip(self.names, self.data):
+                parts.append(packer.pack(name))
+                parts.append(packer.pack(column))
+        return {
+            'statusCode': status_code,
+            'body': base64.b64encode(b''.join(parts)).decode(),
+            'isBase64Encoded': True,
+            'headers': dict(MSGPACK_HEADERS),
+        }
+
+
+def make_writer(fmt, columns=()):
+    """Return the writer for `format=`; raises ValueError for unknown formats"""
+    if fmt == 'rows':
+        return RowsWriter(columns)
+    if fmt == 'columns':
+        return ColumnsWriter(columns)
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise ValueError('format=msgpack is not available in this deployment')
+        return MsgpackWriter(columns)
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
@@ -4,6 +4,7 @@ import xml.etree.ElementTree as ET
 import boto3
 import os
 import datetime
+from list_versions import bump_list_version
 
 # Get the DynamoDB table name from an environment variable
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -92,6 +93,8 @@ def handle_post():
             batch.put_item(Item=item2)
             total_items_added += 1
 
+    bump_list_version(table, "UNLIST-ALL-ACCOUNT")
+
     return {
         'statusCode': 201,
         'headers': {'Content-Type': 'application/json'},
@@ -4,6 +4,7 @@ from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -77,6 +78,7 @@ def lambda_handler(event, context):
         )
 
         print("The response after updating item on DB is ", response_db)
+        bump_list_version(table, partition_key)
 
         return response(200, {'message': 'Item updated successfully'})
     except ClientError as e:
@@ -4,6 +4,7 @@ from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -134,6 +135,7 @@ def lambda_handler(event, context):
             
             # Put the new item
             table.put_item(Item=new_item)
+            bump_list_version(table, partition_key)
             
             return response(200, {'message': 'Item updated successfully', 'new_item': new_item})
             
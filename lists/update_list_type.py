@@ -4,6 +4,7 @@ from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 from decimal import Decimal
+from list_versions import bump_list_version
 
 dynamodb = boto3.resource('dynamodb')
 table_name = os.environ["FRAUD_LISTS_TABLE"]
@@ -74,6 +75,7 @@ def update_list_entries_partition_keys(old_list_type, new_list_type):
             items_to_update.extend(response.get('Items', []))
         
         updated_count = 0
+        touched_partitions = set()
         
         if items_to_update:
             # Update items in batches
@@ -99,6 +101,10 @@ def update_list_entries_partition_keys(old_list_type, new_list_type):
                 )
                 
                 updated_count += 1
+                touched_partitions.update([old_partition_key, new_partition_key])
+        
+        for partition_key in touched_partitions:
+            bump_list_version(table, partition_key)
         
         return updated_count
     
@@ -195,6 +201,7 @@ def update_list_type(list_type, updates):
         else:
             # Just update the existing item
             table.put_item(Item=updated_item)
+        bump_list_version(table, LIST_TYPE_DEFINITION_PK)
         
         return True, {
             'message': f"List type updated successfully",
@@ -3,7 +3,9 @@ import os
 import boto3
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
+from datetime import datetime
 from typing import Optional, List
+from http_cache import compute_etag, if_none_match, not_modified, with_etag
 
 # Initialize the DynamoDB client
 dynamodb = boto3.resource('dynamodb')
@@ -12,6 +14,25 @@ dynamodb = boto3.resource('dynamodb')
 TABLE_NAME = os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE']
 table = dynamodb.Table(TABLE_NAME)
 
+# Version marker bumped on every merchant write; GET ETags are derived from it
+VERSION_KEY = {"PARTITION_KEY": "DATA_VERSION", "SORT_KEY": "MERCHANT_INFO"}
+
+
+def _merchant_version() -> int:
+    item = table.get_item(Key=VERSION_KEY, ConsistentRead=True).get("Item") or {}
+    return int(item.get("version", 0))
+
+
+def _bump_merchant_version() -> None:
+    try:
+        table.update_item(
+            Key=VERSION_KEY,
+            UpdateExpression="ADD version :one SET updated_at = :now",
+            ExpressionAttributeValues={":one": 1, ":now": str(datetime.now())},
+        )
+    except ClientError as e:
+        print(f"Error bumping merchant version: {e.response['Error']['Message']}")
+
 
 def _extract_payload(event: dict) -> Optional[dict]:
     """
@@ -49,6 +70,20 @@ def lambda_handler(event, context):
         qs = event.get("queryStringParameters") or {}
         merchant_id = qs.get("id")
 
+        # Conditional GET: answer 304 from the version marker alone
+        if merchant_id or qs.get("all") == "true":
+            try:
+                etag = compute_etag(qs, _merchant_version())
+            except ClientError as e:
+                error_message = e.response["Error"]["Message"]
+                print(f"DynamoDB ClientError: {error_message}")
+                return {
+                    "statusCode": 500,
+                    "body": json.dumps(f"Error retrieving from DynamoDB: {error_message}"),
+                }
+            if if_none_match(event, etag):
+                return not_modified(etag)
+
         # ---------- GET /merchants?id={merchantId} ----------
         if merchant_id:
             try:
@@ -62,11 +97,11 @@ def lambda_handler(event, context):
                         "statusCode": 404,
                         "body": json.dumps("Merchant not found"),
                     }
-                return {
+                return with_etag({
                     "statusCode": 200,
                     # Ensure any DynamoDB sets are returned as JSON arrays
                     "body": json.dumps(item, default=list),
-                }
+                }, etag)
             except ClientError as e:
                 error_message = e.response["Error"]["Message"]
                 print(f"DynamoDB ClientError: {error_message}")
@@ -88,10 +123,10 @@ def lambda_handler(event, context):
                 for itm in items[:100]:
                     print(json.dumps(itm, default=list))
 
-                return {
+                return with_etag({
                     "statusCode": 200,
                     "body": json.dumps(items, default=list),
-                }
+                }, etag)
             except ClientError as e:
                 error_message = e.response["Error"]["Message"]
                 print(f"DynamoDB ClientError: {error_message}")
@@ -145,6 +180,7 @@ def lambda_handler(event, context):
                 if not last_evaluated_key:
                     break
 
+            _bump_merchant_version()
             return {
                 "statusCode": 200,
                 "body": json.dumps(f"Deleted {deleted} merchant record(s)"),
@@ -230,6 +266,7 @@ def lambda_handler(event, context):
                 if idx < 5:
                     print(f"Saving to DynamoDB table {TABLE_NAME}: {json.dumps(itm, default=list)}")
                 batch.put_item(Item=itm)
+        _bump_merchant_version()
 
         return {
             "statusCode": 200,
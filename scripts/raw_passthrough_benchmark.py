@@ -0,0 +1,120 @@
+"""
+Micro-benchmark for the **Evaluated-Transactions** raw/detail mode.
+
+Compares the CPU cost of building a page of synthetic transactions through
+the default path (decode -> flatten/enrich -> `json.dumps`) with raw mode,
+which splices the stored `processed_transaction` JSON into the response.
+DynamoDB is never called: the enrichment lookups are replaced with in-memory
+stubs so only serialisation work is measured.
+
+Run:
+
+    python scripts\raw_passthrough_benchmark.py [rows_per_page] [repeats]
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("FRAUD_PROCESSED_TRANSACTIONS_TABLE", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "evaluated_transactions"))
+
+import app_with_pagination_3 as app  # noqa: E402
+from response_encoding import raw_response  # noqa: E402
+
+PERIODS = ["HOUR-2025-07-01-10", "DAY-2025-07-01", "WEEK-2025-27", "MONTH-2025-07"]
+LEVELS = [
+    "ACCOUNT_ACC{n}",
+    "ACCOUNT_ACC{n}_APPLICATION_APP1",
+    "ACCOUNT_ACC{n}_APPLICATION_APP1_MERCHANT_M1",
+    "ACCOUNT_ACC{n}_APPLICATION_APP1_MERCHANT_M1_PRODUCT_P1",
+]
+
+
+def synthetic_item(n: int) -> dict:
+    aggregates = {}
+    for level in LEVELS:
+        for period in PERIODS:
+            for metric in ("SUM", "COUNT"):
+                key = f"AGG-card-{level.format(n=n)}-{metric}-{period}"
+                aggregates[key] = {"COUNT": 12, "SUM": 1520.75, "VERSION": 3}
+    processed_transaction = {
+        "original_transaction": {
+            "account_id": f"ACC{n}",
+            "application_id": "APP1",
+            "merchant_id": "M1",
+            "product_id": "P1",
+            "transaction_id": str(uuid.uuid4()),
+            "date": "2025-07-01T10:15:23",
+            "amount": 120.5,
+            "currency": "GHS",
+            "country": "GH",
+            "channel": "card",
+            "name": "Jane Doe",
+        },
+        "evaluation": {"amount_exceeded_account_application": {"rule_version": "1.0"}},
+        "aggregates": aggregates,
+    }
+    return {
+        "PARTITION_KEY": "EVALUATED",
+        "SORT_KEY": f"{1751364923 + n}_{uuid.uuid4()}",
+        "processed_transaction": json.dumps(processed_transaction),
+    }
+
+
+def build_default(items: list) -> str:
+    rows = [app.build_transaction_item(json.loads(item["processed_transaction"])) for item in items]
+    metadata = app.format_paginated_response(rows, 1, len(rows))["metadata"]
+    return app.response(200, {"data": rows, "metadata": metadata})["body"]
+
+
+def build_raw(items: list) -> str:
+    fragments = [
+        app.build_raw_fragment(item, json.loads(item["processed_transaction"])) for item in items
+    ]
+    metadata = app.format_paginated_response(fragments, 1, len(fragments))["metadata"]
+    return raw_response(200, fragments, metadata)["body"]
+
+
+def build_raw_unenriched(items: list) -> str:
+    fragments = [app.build_raw_fragment(item, None, enrich=False) for item in items]
+    metadata = app.format_paginated_response(fragments, 1, len(fragments))["metadata"]
+    return raw_response(200, fragments, metadata)["body"]
+
+
+def measure(label: str, builder, items: list, repeats: int) -> None:
+    body = builder(items)
+    started = time.process_time()
+    for _ in range(repeats):
+        body = builder(items)
+    elapsed = (time.process_time() - started) / repeats
+    megabytes = len(body.encode()) / (1024 * 1024)
+    print(
+        f"{label:<22} {elapsed * 1000:8.2f} ms/page "
+        f"{megabytes:6.2f} MB {elapsed * 1000 / megabytes:8.2f} ms CPU per MB"
+    )
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Enrichment lookups hit DynamoDB in production; stub them out
+    app.assigned_status = lambda transaction_id: {}
+    app.get_merchant_product_data = lambda merchant_id, product_id: {
+        "merchantName": "Acme Ltd",
+        "merchantProductName": "Acme Checkout",
+    }
+
+    items = [synthetic_item(n) for n in range(rows)]
+    print(f"{rows} rows per page, {repeats} repeats")
+    measure("rows (default)", build_default, items, repeats)
+    measure("raw (enriched)", build_raw, items, repeats)
+    measure("raw (enrich=false)", build_raw_unenriched, items, repeats)
+
+
+if __name__ == "__main__":
+    main()
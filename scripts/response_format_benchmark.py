@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for the `format=rows|columns|msgpack` response writers.
+
+Builds a page of synthetic evaluated transactions (see
+`raw_passthrough_benchmark.py`) and a page of list entries, then reports the
+payload size and the CPU spent encoding each format.  Row values are built
+once up front so only the writer's work is timed.  DynamoDB is never called.
+
+Run:
+
+    python scripts\response_format_benchmark.py [rows_per_page] [repeats]
+"""
+import json
+import sys
+import time
+
+from raw_passthrough_benchmark import app, synthetic_item
+from response_encoding import make_writer
+
+
+def list_entry(n: int) -> dict:
+    return {
+        "created_at": "2025-07-01 10:15:23.000000",
+        "list_type": "BLACKLIST",
+        "channel": "card",
+        "entity_type": "MERCHANT",
+        "description": "Chargeback ratio above threshold",
+        "entity_id": f"APP1__M{n}",
+        "account_ref": "",
+        "processor": "APP1",
+        "merchant_id": f"M{n}",
+        "product_id": "",
+    }
+
+
+def encode_transactions(fmt: str, page: list) -> dict:
+    writer = make_writer(fmt, app.TRANSACTION_COLUMNS)
+    for values in page:
+        writer.add(values)
+    return writer.render(200, app.format_paginated_response(writer, 1, len(writer))["metadata"])
+
+
+def encode_list_entries(fmt: str, entries: list) -> dict:
+    writer = make_writer(fmt)
+    for entry in entries:
+        writer.add_mapping(entry)
+    return writer.render(200, None)
+
+
+def measure(label: str, encode, fmt: str, rows: list, repeats: int) -> None:
+    result = encode(fmt, rows)
+    started = time.process_time()
+    for _ in range(repeats):
+        result = encode(fmt, rows)
+    elapsed = (time.process_time() - started) / repeats
+    print(f"{label:<14} {fmt:<8} {len(result['body']):>10,} bytes {elapsed * 1000:8.2f} ms/page")
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    app.assigned_status = lambda transaction_id: {}
+    app.get_merchant_product_data = lambda merchant_id, product_id: {
+        "merchantName": "Acme Ltd",
+        "merchantProductName": "Acme Checkout",
+    }
+
+    page = [
+        app.build_transaction_values(json.loads(synthetic_item(n)["processed_transaction"]))
+        for n in range(rows)
+    ]
+    entries = [list_entry(n) for n in range(rows)]
+    print(f"{rows} rows per page, {repeats} repeats (msgpack sizes are base64)")
+    for fmt in ("rows", "columns", "msgpack"):
+        measure("transactions", encode_transactions, fmt, page, repeats)
+    for fmt in ("rows", "columns", "msgpack"):
+        measure("lists", encode_list_entries, fmt, entries, repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,41 @@
 import os
 import json
+import uuid
 import boto3
 from boto3.dynamodb.conditions import Key
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from summary_engine import GROUP_DIMENSIONS
+from summary_jobs import (
+    JobConflict, continue_chain, deadline_for, is_finished, job_result, load_job, new_job, progress,
+    run_job, save_job, start_chain,
+)
+from summary_sampling import DEFAULT_SAMPLE_WINDOWS, MAX_SAMPLE_WINDOWS, estimate
 
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE'])
 
 def lambda_handler(event, context):
+    # Async link of a chained job (summary_jobs.py), not an API request
+    if 'summary_continuation' in event:
+        continue_chain(event['summary_continuation'], context)
+        return
     try:
         query_params = event['queryStringParameters'] or {}
+
+        # continuation=<job id> resumes (or, for a chained job, polls) a
+        # summary that did not finish within one call
+        continuation = query_params.get('continuation')
+        if continuation:
+            job, version = load_job(continuation)
+            if job is None:
+                return response(400, {'message': 'Unknown or expired continuation token'})
+            if job['chained'] or is_finished(job):
+                return response(200, job_result(job), progress(job, continuation))
+            run_job(job, deadline_for(context))
+            save_job(continuation, job, version)
+            return response(200, job_result(job), progress(job, continuation))
+
         start_date = query_params.get('start_date')
         end_date = query_params.get('end_date')
         
@@ -20,57 +46,102 @@ def lambda_handler(event, context):
         end_timestamp = int((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).timestamp() - 1)
 
         #end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp())
+
+        group_by = tuple(d.strip().lower() for d in query_params.get('group_by', '').split(',') if d.strip())
+        unknown = [d for d in group_by if d not in GROUP_DIMENSIONS]
+        if unknown or len(set(group_by)) != len(group_by):
+            return response(400, {'message': f"group_by must be distinct values of: {', '.join(GROUP_DIMENSIONS)}"})
+
+        # compare=previous_period|previous_year adds a second window
+        compare = query_params.get('compare')
+        if compare and compare not in COMPARE_WINDOWS:
+            return response(400, {'message': f"compare must be one of: {', '.join(COMPARE_WINDOWS)}"})
+
+        # mode=approx extrapolates from a stratified sample of time windows
+        mode = query_params.get('mode', 'exact')
+        if mode not in ('exact', 'approx'):
+            return response(400, {'message': 'mode must be exact or approx'})
+        if mode == 'approx':
+            if group_by or compare:
+                return response(400, {'message': 'group_by and compare are not supported with mode=approx'})
+            try:
+                windows = int(query_params.get('sample_windows', DEFAULT_SAMPLE_WINDOWS))
+            except ValueError:
+                windows = 0
+            if not 2 <= windows <= MAX_SAMPLE_WINDOWS:
+                return response(400, {'message': f"sample_windows must be between 2 and {MAX_SAMPLE_WINDOWS}"})
+            data, metadata = estimate(start_timestamp, end_timestamp, windows)
+            return response(200, data, metadata)
         
-        summary = {
-            'blacklist': {'count': 0, 'sum': 0},
-            'watchlist': {'count': 0, 'sum': 0},
-            'stafflist': {'count': 0, 'sum': 0},
-            'limits': {'count': 0, 'sum': 0},
-            'normal': {'count': 0, 'sum': 0}
-        }
-        
-        for list_type in ['BLACKLIST', 'WATCHLIST', 'STAFF', 'LIMIT']:
-            items = query_transactions(f"EVALUATED-{list_type}", start_timestamp, end_timestamp)
-            for item in items:
-                processed_transaction = json.loads(item["processed_transaction"])
-                original_transaction = processed_transaction["original_transaction"]
-                amount = float(original_transaction['amount'])
-                
-                if list_type == 'STAFF':
-                    list_type = 'stafflist'
-                elif list_type == 'LIMIT':
-                    list_type = 'limits'
-                
-                summary[list_type.lower()]['count'] += 1
-                summary[list_type.lower()]['sum'] += amount
-        
-        # Query for normal transactions
-        normal_items = query_transactions("EVALUATED", start_timestamp, end_timestamp)
-        for item in normal_items:
-            processed_transaction = json.loads(item["processed_transaction"])
-            if not processed_transaction.get('evaluation'):  # No evaluation means it's a normal transaction
-                original_transaction = processed_transaction["original_transaction"]
-                amount = float(original_transaction['amount'])
-                summary['normal']['count'] += 1
-                summary['normal']['sum'] += amount
-        
-        return response(200, summary)
-    
+        # Whole days come from the daily rollups (summary_rollup.py); other
+        # closed days from the per-day memo (summary_memo.py), and only the
+        # rest of the range is read from all five partitions concurrently.
+        # The rollups hold bucket totals only, so group_by goes to the memo.
+        # source=raw skips both, e.g. to cross-check them; refresh=true
+        # recomputes the memoized days.
+        refresh = str(query_params.get('refresh', '')).lower() == 'true'
+        previous = None
+        if compare:
+            previous_start, previous_end = COMPARE_WINDOWS[compare](
+                datetime.strptime(start_date, '%Y-%m-%d').date(), datetime.strptime(end_date, '%Y-%m-%d').date()
+            )
+            previous = (
+                int(datetime.combine(previous_start, datetime.min.time()).timestamp()),
+                int(datetime.combine(previous_end + timedelta(days=1), datetime.min.time()).timestamp() - 1),
+            )
+        job = new_job(start_timestamp, end_timestamp, group_by, query_params.get('source'), refresh, previous)
+        if compare:
+            job['compare'] = {
+                'window': compare,
+                'previous_start_date': previous_start.isoformat(),
+                'previous_end_date': previous_end.isoformat(),
+            }
+
+        # async=true: leave the reading to chained invocations and poll
+        if str(query_params.get('async', '')).lower() == 'true' and not is_finished(job):
+            job_id = start_chain(job, context)
+            return response(200, job_result(job), progress(job, job_id))
+
+        # Otherwise read until the time budget runs out; an unfinished
+        # summary is returned as is, with a continuation token
+        run_job(job, deadline_for(context))
+        if is_finished(job):
+            return response(200, job_result(job), progress(job) if compare else None)
+        job_id = uuid.uuid4().hex
+        save_job(job_id, job, 0)
+        return response(200, job_result(job), progress(job, job_id))
+
+    except JobConflict:
+        return response(409, {'message': 'This continuation was resumed concurrently; retry with the same token'})
     except Exception as e:
         print("An error occurred ", e)
         return response(500, {'message': str(e)})
 
-def query_transactions(partition_key, start_timestamp, end_timestamp):
-    start_sk = f"{start_timestamp}_"
-    end_sk = f"{end_timestamp}_z"
-    
-    response = table.query(
-        KeyConditionExpression=Key('PARTITION_KEY').eq(partition_key) & Key('SORT_KEY').between(start_sk, end_sk)
-    )
-    
-    return response['Items']
-
-def response(status_code, body):
+def previous_period(start, end):
+    """The window of the same length ending the day before *start*"""
+    length = end - start
+    return start - length - timedelta(days=1), start - timedelta(days=1)
+
+def previous_year(start, end):
+    """The same dates a year earlier (29 February becomes the 28th)"""
+    def shift(day):
+        try:
+            return day.replace(year=day.year - 1)
+        except ValueError:
+            return date(day.year - 1, 2, 28)
+    return shift(start), shift(end)
+
+COMPARE_WINDOWS = {
+    'previous_period': previous_period,
+    'previous_year': previous_year,
+}
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def response(status_code, body, metadata=None):
     response_message = ""
     if status_code == 200:
         response_message = "Operation Successful"
@@ -81,9 +152,11 @@ def response(status_code, body):
         "responseMessage": response_message,
         "data": body
     }
+    if metadata is not None:
+        body_to_send["metadata"] = metadata
     return {
         'statusCode': status_code,
-        'body': json.dumps(body_to_send),
+        'body': json.dumps(body_to_send, default=json_default),
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
@@ -0,0 +1,111 @@
+"""
+Backfill of the flattened summary attributes (`summary_engine.FLAT_ATTRIBUTES`).
+
+The summary engine reads `amount`, `currency`, `channel`, `country`,
+`application_id` and `has_evaluation` when an item has them and otherwise
+decodes the `processed_transaction` blob projected with them.  This tool
+copies the fields onto existing items so later summaries skip that
+decoding; it saves CPU, not reads.
+
+Each source partition's range is split into `segments` time slices that are
+processed in parallel.  A slice reads only items missing the attributes and
+sets them with one conditional `UpdateItem` each, so reruns and overlapping
+runs are harmless.  When the invocation runs low on time the unfinished
+slices are returned as `remaining`; invoking again with them resumes.
+
+    {"start_day": "2024-01-01", "end_day": "2025-07-31", "segments": 8}
+    {"remaining": [["EVALUATED", "1719792000_3f2a...", 1722470399], ...]}
+"""
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from summary_engine import (
+    FLAT_FIELDS, MAX_WORKERS, SUMMARY_SOURCES, flatten_blob, split_range, thread_table, to_decimal,
+)
+
+DEFAULT_SEGMENTS = 8
+BACKFILL_SAFETY_MARGIN_MS = 30000
+
+
+def flatten_item(partition_key, sort_key, blob):
+    """SET the flattened attributes of one item; False if it no longer exists"""
+    transaction, has_evaluation = flatten_blob(blob)
+    if 'amount' not in transaction:
+        return False
+    values = dict(transaction, amount=to_decimal(transaction['amount']), has_evaluation=has_evaluation)
+    try:
+        thread_table().update_item(
+            Key={'PARTITION_KEY': partition_key, 'SORT_KEY': sort_key},
+            UpdateExpression='SET ' + ', '.join(f"#{name} = :{name}" for name in values),
+            ConditionExpression='attribute_exists(processed_transaction)',
+            ExpressionAttributeNames={f"#{name}": name for name in values},
+            ExpressionAttributeValues={f":{name}": value for name, value in values.items()},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+
+def backfill_slice(partition_key, lower_sort_key, end_timestamp, context=None):
+    """
+    Flatten every unflattened item from *lower_sort_key* to the end of
+    *end_timestamp*.  Returns `(items updated, resume sort key or None)`.
+    """
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').between(lower_sort_key, f"{end_timestamp}_z"),
+        'FilterExpression': Attr('has_evaluation').not_exists() | Attr('amount').not_exists(),
+        'ProjectionExpression': 'SORT_KEY, processed_transaction',
+    }
+    updated = 0
+    while True:
+        response = thread_table().query(**query_kwargs)
+        for item in response.get('Items', []):
+            if flatten_item(partition_key, item['SORT_KEY'], item['processed_transaction']):
+                updated += 1
+        if 'LastEvaluatedKey' not in response:
+            return updated, None
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        if context and context.get_remaining_time_in_millis() < BACKFILL_SAFETY_MARGIN_MS:
+            # The next query starts at this key; `between` includes it again
+            return updated, response['LastEvaluatedKey']['SORT_KEY']
+
+
+def backfill(ranges, context=None):
+    """Run `[(partition key, lower sort key, end timestamp)]` slices in parallel"""
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(ranges))) as pool:
+        results = list(pool.map(lambda task: backfill_slice(*task, context), ranges))
+    remaining = [
+        [partition_key, resume, end_timestamp]
+        for (partition_key, _, end_timestamp), (_, resume) in zip(ranges, results)
+        if resume is not None
+    ]
+    return {'updated': sum(updated for updated, _ in results), 'remaining': remaining}
+
+
+def initial_ranges(start_day, end_day, segments):
+    start_timestamp = calendar.timegm(datetime.strptime(start_day, '%Y-%m-%d').timetuple())
+    end_timestamp = calendar.timegm(datetime.strptime(end_day, '%Y-%m-%d').timetuple()) + 86399
+    return [
+        (partition_key, f"{lower}_", upper)
+        for partition_key, _, _ in SUMMARY_SOURCES
+        for lower, upper in split_range(start_timestamp, end_timestamp, segments)
+    ]
+
+
+def lambda_handler(event, context):
+    event = event or {}
+    if event.get('remaining'):
+        ranges = [tuple(entry) for entry in event['remaining']]
+    else:
+        ranges = initial_ranges(event['start_day'], event['end_day'], int(event.get('segments', DEFAULT_SEGMENTS)))
+    result = backfill(ranges, context)
+    print(f"Flattened {result['updated']} items of {', '.join(FLAT_FIELDS)}; "
+          f"{len(result['remaining'])} slices remaining")
+    return result
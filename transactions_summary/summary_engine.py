@@ -0,0 +1,344 @@
+"""
+Streaming summary engine for `GET /transaction-summary`.
+
+Every source partition is read with a full `LastEvaluatedKey` loop (a
+single query stops at 1 MB), and the five partitions, each split into
+SUMMARY_SLICES time slices, are read concurrently.  Items are folded into
+per-worker accumulators as each page arrives, so no item lists are built.
+
+Queries project the flattened top-level copies of the fields the summary
+needs (FLAT_ATTRIBUTES) together with the `processed_transaction` blob.
+Flattened items are used as they are; for the others only the
+`original_transaction` and `evaluation` fields of the blob that came with
+the same page are decoded, so no item is ever read twice.
+`summary_backfill.py` flattens existing items.
+
+Amounts are parsed straight to `Decimal` and summed exactly.  With
+`group_by` each bucket also keeps a tuple-keyed `{(channel, currency, ...):
+[count, sum]}` accumulator, filled in the same pass; at most
+SUMMARY_MAX_GROUPS distinct groups are kept per bucket and any further
+group is folded into an "other" row, so memory stays bounded.
+
+The work is a list of slice tasks `[partition key, lower sort key, upper
+sort key, resume sort key]`.  `run_tasks()` can be given a deadline: each
+slice then stops after the page that crosses it and comes back as a task
+resuming after its last evaluated key (see `summary_jobs.py`).
+"""
+import calendar
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+TABLE_NAME = os.environ['FRAUD_PROCESSED_TRANSACTIONS_TABLE']
+
+MAX_WORKERS = int(os.environ.get('SUMMARY_MAX_WORKERS', 10))
+SUMMARY_SLICES = int(os.environ.get('SUMMARY_SLICES', 4))
+
+# Transactions older than this are assumed to have been written
+SUMMARY_SETTLE_SECONDS = int(os.environ.get('SUMMARY_SETTLE_SECONDS', 300))
+
+# (partition key, summary bucket, only transactions without an evaluation)
+SUMMARY_SOURCES = (
+    ('EVALUATED-BLACKLIST', 'blacklist', False),
+    ('EVALUATED-WATCHLIST', 'watchlist', False),
+    ('EVALUATED-STAFF', 'stafflist', False),
+    ('EVALUATED-LIMIT', 'limits', False),
+    ('EVALUATED', 'normal', True),
+)
+SUMMARY_BUCKETS = tuple(bucket for _, bucket, _ in SUMMARY_SOURCES)
+SOURCE_BY_PARTITION = {partition_key: (bucket, normal_only) for partition_key, bucket, normal_only in SUMMARY_SOURCES}
+
+# group_by dimension -> `original_transaction` field (`day` comes from the sort key)
+GROUP_DIMENSIONS = {
+    'channel': 'channel',
+    'currency': 'currency',
+    'country': 'country',
+    'processor': 'application_id',
+    'day': None,
+}
+SUMMARY_MAX_GROUPS = int(os.environ.get('SUMMARY_MAX_GROUPS', 1000))
+OTHER_GROUP = 'other'
+
+# Top-level copies of `original_transaction` fields, plus `has_evaluation`
+FLAT_FIELDS = ('amount', 'currency', 'channel', 'country', 'application_id')
+FLAT_ATTRIBUTES = FLAT_FIELDS + ('has_evaluation',)
+# The blob is projected too: the processed-transaction writer does not set
+# the flattened attributes, and reading it in the same query costs no extra
+# read capacity (DynamoDB bills the whole item whatever the projection)
+FLAT_PROJECTION = {
+    'ProjectionExpression': ', '.join(
+        ['SORT_KEY', 'processed_transaction'] + [f"#{name}" for name in FLAT_ATTRIBUTES]
+    ),
+    'ExpressionAttributeNames': {f"#{name}": name for name in FLAT_ATTRIBUTES},
+}
+
+_local = threading.local()
+_DECODER = json.JSONDecoder(parse_float=Decimal)
+
+
+def thread_table():
+    """boto3 resources are not thread-safe, so each worker thread gets its own Table"""
+    table = getattr(_local, 'table', None)
+    if table is None:
+        table = boto3.session.Session().resource('dynamodb').Table(TABLE_NAME)
+        _local.table = table
+    return table
+
+
+def flatten_blob(blob):
+    """`(transaction fields, has_evaluation)` decoded from a `processed_transaction` blob"""
+    original_transaction = extract_field(blob, 'original_transaction', {})
+    transaction = {field: original_transaction[field] for field in FLAT_FIELDS if field in original_transaction}
+    return transaction, bool(extract_field(blob, 'evaluation'))
+
+
+def is_flattened(item):
+    return 'amount' in item and 'has_evaluation' in item
+
+
+def transaction_records(items):
+    """
+    `[(sort key, transaction fields, has_evaluation)]` for a page of items
+    queried with FLAT_PROJECTION, in page order; items without the
+    flattened attributes are decoded from their projected blobs.
+    """
+    records = []
+    for item in items:
+        if is_flattened(item):
+            transaction = {field: item[field] for field in FLAT_FIELDS if field in item}
+            has_evaluation = item['has_evaluation']
+        elif 'processed_transaction' in item:
+            transaction, has_evaluation = flatten_blob(item['processed_transaction'])
+        else:
+            continue
+        records.append((item['SORT_KEY'], transaction, has_evaluation))
+    return records
+
+
+def iter_pages(partition_key, lower_sort_key, upper_sort_key, resume_sort_key=None, stats=None):
+    """
+    Yield `(records, last evaluated sort key or None)` for each page of the
+    range, starting after *resume_sort_key* when given.
+    """
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').between(lower_sort_key, upper_sort_key),
+        **FLAT_PROJECTION,
+    }
+    if resume_sort_key:
+        query_kwargs['ExclusiveStartKey'] = {'PARTITION_KEY': partition_key, 'SORT_KEY': resume_sort_key}
+    while True:
+        response = thread_table().query(**query_kwargs)
+        items = response.get('Items', [])
+        if stats is not None:
+            stats['items'] += len(items)
+            stats['blob_decodes'] += sum(1 for item in items if not is_flattened(item))
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        yield transaction_records(items), last_evaluated_key and last_evaluated_key['SORT_KEY']
+        if not last_evaluated_key:
+            return
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+
+def extract_field(blob, name, default=None):
+    """Decode only the top-level *name* field of a `processed_transaction` blob"""
+    marker = f'"{name}":'
+    index = blob.find(marker)
+    if index < 0:
+        return default
+    index += len(marker)
+    while blob[index] in ' \t\r\n':
+        index += 1
+    value, _ = _DECODER.raw_decode(blob, index)
+    return value
+
+
+def split_range(start_timestamp, end_timestamp, slices):
+    """Split the inclusive range into at most *slices* contiguous sub-ranges"""
+    span = end_timestamp - start_timestamp + 1
+    slices = max(1, min(slices, span))
+    step = -(-span // slices)
+    return [
+        (lower, min(lower + step - 1, end_timestamp))
+        for lower in range(start_timestamp, end_timestamp + 1, step)
+    ]
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def day_start(day):
+    return calendar.timegm(datetime.strptime(day, '%Y-%m-%d').timetuple())
+
+
+def to_decimal(amount):
+    """Amounts are decoded as Decimal or int; strings are accepted too"""
+    return amount if isinstance(amount, Decimal) else Decimal(str(amount))
+
+
+def empty_summary():
+    return {bucket: {'count': 0, 'sum': Decimal(0)} for bucket in SUMMARY_BUCKETS}
+
+
+def restore_sums(summary):
+    """Turn the sums of a JSON-decoded summary (written with `default=str`) back into Decimal"""
+    for totals in summary.values():
+        totals['sum'] = to_decimal(totals['sum'])
+        for row in totals.get('groups', ()):
+            row['sum'] = to_decimal(row['sum'])
+    return summary
+
+
+class GroupAccumulator:
+    """`{group tuple: [count, sum]}` holding at most *max_groups* groups plus "other" """
+
+    __slots__ = ('groups', 'max_groups', 'other_key')
+
+    def __init__(self, dimensions, max_groups=SUMMARY_MAX_GROUPS):
+        self.groups = {}
+        self.max_groups = max_groups
+        self.other_key = (OTHER_GROUP,) * len(dimensions)
+
+    def add(self, key, count, total):
+        entry = self.groups.get(key)
+        if entry is None:
+            if len(self.groups) >= self.max_groups + (self.other_key in self.groups):
+                key = self.other_key
+                entry = self.groups.get(key)
+            if entry is None:
+                entry = self.groups[key] = [0, Decimal(0)]
+        entry[0] += count
+        entry[1] += total
+
+    def merge(self, other):
+        for key, (count, total) in other.groups.items():
+            self.add(key, count, total)
+
+    def rows(self, dimensions):
+        """Largest groups first, "other" last"""
+        ordered = sorted(
+            self.groups.items(),
+            key=lambda entry: (entry[0] == self.other_key, -entry[1][1], entry[0])
+        )
+        return [
+            dict(zip(dimensions, key), count=count, sum=total)
+            for key, (count, total) in ordered
+        ]
+
+
+def merge_summaries(summaries, group_by=()):
+    """Add summaries (e.g. of consecutive ranges) together, re-applying the group cap"""
+    merged = empty_summary()
+    grouped = {bucket: GroupAccumulator(group_by) for bucket in SUMMARY_BUCKETS} if group_by else None
+    for summary in summaries:
+        for bucket, totals in summary.items():
+            merged[bucket]['count'] += totals['count']
+            merged[bucket]['sum'] += totals['sum']
+            if grouped is not None:
+                for row in totals.get('groups', ()):
+                    grouped[bucket].add(tuple(row[d] for d in group_by), row['count'], row['sum'])
+    if grouped is not None:
+        for bucket, groups in grouped.items():
+            merged[bucket]['groups'] = groups.rows(group_by)
+    return merged
+
+
+def plan_tasks(start_timestamp, end_timestamp, slices=SUMMARY_SLICES):
+    """Slice tasks covering the range in every source partition"""
+    return [
+        [partition_key, f"{lower}_", f"{upper}_z", None]
+        for partition_key, _, _ in SUMMARY_SOURCES
+        for lower, upper in split_range(start_timestamp, end_timestamp, slices)
+    ]
+
+
+def summarize_slice(task, group_by=(), deadline=None):
+    """
+    Worker: `(bucket, count, sum, GroupAccumulator or None, read stats,
+    resume sort key or None)` of one slice task.  Past *deadline* (a
+    `time.monotonic()` value) it stops after the current page.
+    """
+    partition_key, lower_sort_key, upper_sort_key, resume_sort_key = task
+    bucket, normal_only = SOURCE_BY_PARTITION[partition_key]
+    count = 0
+    total = Decimal(0)
+    groups = GroupAccumulator(group_by) if group_by else None
+    fields = [GROUP_DIMENSIONS[dimension] for dimension in group_by]
+    stats = {'items': 0, 'blob_decodes': 0}
+    for records, resume_sort_key in iter_pages(
+            partition_key, lower_sort_key, upper_sort_key, resume_sort_key, stats):
+        for sort_key, transaction, has_evaluation in records:
+            if normal_only and has_evaluation:
+                continue
+            amount = to_decimal(transaction['amount'])
+            count += 1
+            total += amount
+            if groups is not None:
+                key = tuple(
+                    str(transaction.get(field, '')) if field
+                    else day_of(int(sort_key.split('_', 1)[0]))
+                    for field in fields
+                )
+                groups.add(key, 1, amount)
+        if resume_sort_key and deadline is not None and time.monotonic() >= deadline:
+            break
+    return bucket, count, total, groups, stats, resume_sort_key
+
+
+def run_task_lists(task_lists, group_by=(), deadline=None):
+    """
+    Run several independent lists of slice tasks (e.g. two compared
+    windows) on one thread pool; returns `[(summary, unfinished tasks)]`
+    in the same order.  Without a deadline every task runs to the end of
+    its range.
+    """
+    flat = [(index, task) for index, tasks in enumerate(task_lists) for task in tasks]
+    summaries = [empty_summary() for _ in task_lists]
+    grouped = [
+        {bucket: GroupAccumulator(group_by) for bucket in SUMMARY_BUCKETS} if group_by else None
+        for _ in task_lists
+    ]
+    remaining = [[] for _ in task_lists]
+    items = blob_decodes = 0
+    if flat:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(flat))) as pool:
+            results = pool.map(lambda entry: summarize_slice(entry[1], group_by, deadline), flat)
+            for (index, task), (bucket, count, total, groups, stats, resume_sort_key) in zip(flat, results):
+                summaries[index][bucket]['count'] += count
+                summaries[index][bucket]['sum'] += total
+                if groups is not None:
+                    grouped[index][bucket].merge(groups)
+                items += stats['items']
+                blob_decodes += stats['blob_decodes']
+                if resume_sort_key:
+                    remaining[index].append([task[0], task[1], task[2], resume_sort_key])
+    if blob_decodes:
+        print(f"Summary read {items} items, decoded {blob_decodes} blobs without flattened attributes")
+    for summary, groups_by_bucket in zip(summaries, grouped):
+        if groups_by_bucket is not None:
+            for bucket, groups in groups_by_bucket.items():
+                summary[bucket]['groups'] = groups.rows(group_by)
+    return list(zip(summaries, remaining))
+
+
+def run_tasks(tasks, group_by=(), deadline=None):
+    """Run slice tasks concurrently; returns `(summary, unfinished tasks)`"""
+    return run_task_lists([tasks], group_by, deadline)[0]
+
+
+def summarize(start_timestamp, end_timestamp, slices=SUMMARY_SLICES, group_by=()):
+    """
+    `{bucket: {'count', 'sum'}}` over every source partition, read
+    concurrently.  With *group_by* each bucket also gets `groups`: one row
+    per distinct combination of the dimensions.
+    """
+    summary, _ = run_tasks(plan_tasks(start_timestamp, end_timestamp, slices), group_by)
+    return summary
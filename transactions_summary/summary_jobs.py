@@ -0,0 +1,240 @@
+"""
+Time-budgeted, resumable `GET /transaction-summary` requests.
+
+A request is planned into a job:
+
+    summary  partial summary: rollup days and memoized days, added up front
+    days     closed days still to compute (and memoize), see summary_memo.py
+    tasks    raw slice tasks [partition key, lower, upper, resume sort key]
+    previous the job of the compared window (`compare=`), if any
+
+`run_job()` works through `days` and then `tasks` until the deadline, which
+is the invocation's remaining time (capped at the API Gateway limit) minus
+SUMMARY_BUDGET_MARGIN_MS.  An unfinished job is stored as
+
+    PARTITION_KEY = "SUMMARY_JOB"
+    SORT_KEY      = <job id>                      (the continuation token)
+    state         = zlib-compressed JSON of the job
+    version       = bumped on every save; saves are conditional on it
+    expires_at    = TTL, SUMMARY_JOB_TTL_SECONDS after the last save
+
+and the client resumes it with `continuation=<job id>`.  The token is a key,
+not the state itself: a grouped partial summary can be far larger than a
+URL allows.  With `async=true` the handler instead invokes its own function
+asynchronously with `{"summary_continuation": <job id>}` until the job is
+done, and `continuation=<job id>` only reads the progress.
+"""
+import json
+import os
+import time
+import uuid
+import zlib
+
+import boto3
+from botocore.exceptions import ClientError
+
+from summary_engine import merge_summaries, plan_tasks, restore_sums, run_task_lists, thread_table
+from summary_memo import fill_days, plan_memoized
+from summary_rollup import plan_with_rollups
+
+JOB_PARTITION_KEY = "SUMMARY_JOB"
+
+SUMMARY_BUDGET_MARGIN_MS = int(os.environ.get('SUMMARY_BUDGET_MARGIN_MS', 5000))
+SUMMARY_JOB_TTL_SECONDS = int(os.environ.get('SUMMARY_JOB_TTL_SECONDS', 86400))
+# API Gateway gives up on the integration after 29 s whatever the Lambda timeout
+API_TIMEOUT_MS = 29000
+
+
+class JobConflict(Exception):
+    """The job was saved by another invocation since it was loaded"""
+
+
+def new_job(start_timestamp, end_timestamp, group_by=(), source=None, refresh=False, previous=None):
+    """
+    Plan a request; stored results are summed now, the rest is queued.
+    *previous* is the `(start, end)` of a window to compare with.
+    """
+    summaries = []
+    days = []
+    live_ranges = []
+    if source == 'raw':
+        live_ranges.append((start_timestamp, end_timestamp))
+    else:
+        # The rollups hold bucket totals only
+        ranges = [(start_timestamp, end_timestamp)]
+        if not group_by:
+            rollup_summary, ranges = plan_with_rollups(start_timestamp, end_timestamp)
+            if rollup_summary is not None:
+                summaries.append(rollup_summary)
+        for lower, upper in ranges:
+            found, missing, live = plan_memoized(lower, upper, group_by, refresh)
+            summaries += found
+            days += missing
+            live_ranges += live
+    job = {
+        'group_by': list(group_by),
+        'summary': merge_summaries(summaries, group_by),
+        'days': days,
+        'tasks': [task for lower, upper in live_ranges for task in plan_tasks(lower, upper)],
+        'chained': False,
+    }
+    if previous is not None:
+        job['previous'] = new_job(*previous, group_by, source, refresh)
+    return job
+
+
+def windows(job):
+    """The job and its compared window's job"""
+    return [job, job['previous']] if 'previous' in job else [job]
+
+
+def is_finished(job):
+    return all(not window['days'] and not window['tasks'] for window in windows(job))
+
+
+def run_job(job, deadline=None):
+    """
+    Advance *job* (and its compared window) until finished or *deadline*
+    (`time.monotonic()`) passes.  Both windows share one `fill_days()` call,
+    so a day they have in common is computed once, and one slice pool.
+    """
+    group_by = tuple(job['group_by'])
+    parts = windows(job)
+    days = list(dict.fromkeys(day for window in parts for day in window['days']))
+    computed, _ = fill_days(days, group_by, deadline)
+    summaries = [[window['summary']] for window in parts]
+    for window, window_summaries in zip(parts, summaries):
+        window_summaries += [computed[day] for day in window['days'] if day in computed]
+        window['days'] = [day for day in window['days'] if day not in computed]
+
+    # Raw slices start once a window's days are done
+    ready = [index for index, window in enumerate(parts) if not window['days'] and window['tasks']]
+    results = run_task_lists([parts[index]['tasks'] for index in ready], group_by, deadline)
+    for index, (partial, remaining) in zip(ready, results):
+        summaries[index].append(partial)
+        parts[index]['tasks'] = remaining
+
+    for window, window_summaries in zip(parts, summaries):
+        window['summary'] = merge_summaries(window_summaries, group_by)
+    return job
+
+
+def percent_change(current, previous):
+    return round(float((current - previous) / previous * 100), 2) if previous else None
+
+
+def job_result(job):
+    """
+    The response data: the summary, and with a compared window each bucket
+    also gets `previous` (its totals) and `delta`
+    """
+    if 'previous' not in job:
+        return job['summary']
+    data = {}
+    for bucket, totals in job['summary'].items():
+        previous = job['previous']['summary'][bucket]
+        data[bucket] = dict(
+            totals,
+            previous=previous,
+            delta={
+                'count': totals['count'] - previous['count'],
+                'sum': totals['sum'] - previous['sum'],
+                'count_pct': percent_change(totals['count'], previous['count']),
+                'sum_pct': percent_change(totals['sum'], previous['sum']),
+            },
+        )
+    return data
+
+
+def deadline_for(context, api=True):
+    """`time.monotonic()` value by which a run should stop; None without a context"""
+    if context is None:
+        return None
+    remaining_ms = context.get_remaining_time_in_millis()
+    if api:
+        remaining_ms = min(remaining_ms, API_TIMEOUT_MS)
+    return time.monotonic() + max(remaining_ms - SUMMARY_BUDGET_MARGIN_MS, 0) / 1000
+
+
+def save_job(job_id, job, version):
+    """Store *job* as *version* + 1, unless someone else saved *version* first"""
+    state = zlib.compress(json.dumps(job, default=str, separators=(',', ':')).encode())
+    try:
+        thread_table().put_item(
+            Item={
+                'PARTITION_KEY': JOB_PARTITION_KEY,
+                'SORT_KEY': job_id,
+                'state': state,
+                'version': version + 1,
+                'expires_at': int(time.time()) + SUMMARY_JOB_TTL_SECONDS,
+            },
+            ConditionExpression='attribute_not_exists(PARTITION_KEY) OR version = :version',
+            ExpressionAttributeValues={':version': version},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise JobConflict(job_id)
+        raise
+    return version + 1
+
+
+def load_job(job_id):
+    """`(job, version)`, or `(None, None)` for an unknown or expired token"""
+    item = thread_table().get_item(
+        Key={'PARTITION_KEY': JOB_PARTITION_KEY, 'SORT_KEY': job_id},
+        ConsistentRead=True,
+    ).get('Item')
+    if not item or int(item['expires_at']) < time.time():
+        return None, None
+    job = json.loads(zlib.decompress(item['state'].value))
+    for window in windows(job):
+        restore_sums(window['summary'])
+    return job, int(item['version'])
+
+
+def progress(job, job_id=None):
+    """Response metadata describing how far *job* has got"""
+    metadata = {'complete': is_finished(job)}
+    if 'compare' in job:
+        metadata['compare'] = job['compare']
+    if not metadata['complete']:
+        metadata.update({
+            'continuation': job_id,
+            'days_remaining': sum(len(window['days']) for window in windows(job)),
+            'slices_remaining': sum(len(window['tasks']) for window in windows(job)),
+            'chained': job['chained'],
+        })
+    return metadata
+
+
+def chain(job_id, context):
+    """Invoke this function asynchronously to continue *job_id*"""
+    boto3.client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({'summary_continuation': job_id}).encode(),
+    )
+
+
+def start_chain(job, context):
+    """Hand a new job over to async invocations; returns its id"""
+    job_id = uuid.uuid4().hex
+    job['chained'] = True
+    save_job(job_id, job, 0)
+    chain(job_id, context)
+    return job_id
+
+
+def continue_chain(job_id, context):
+    """One async link: advance the stored job and re-invoke while unfinished"""
+    job, version = load_job(job_id)
+    if job is None or is_finished(job):
+        return
+    run_job(job, deadline_for(context, api=False))
+    try:
+        save_job(job_id, job, version)
+    except JobConflict:
+        print(f"Summary job {job_id} was saved concurrently; stopping this chain")
+        return
+    if not is_finished(job):
+        chain(job_id, context)
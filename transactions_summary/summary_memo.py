@@ -0,0 +1,244 @@
+"""
+Closed-day memo for `GET /transaction-summary`.
+
+A UTC day that ended more than SUMMARY_SETTLE_SECONDS ago is treated as
+closed, so its summary (for a given `group_by`) is computed once and kept
+in two places:
+
+* an in-process LRU of SUMMARY_MEMO_LRU_SIZE days, which warm Lambda
+  containers reuse across requests, and
+* one item per day and `group_by` in the processed-transactions table:
+
+      PARTITION_KEY = "SUMMARY_MEMO"
+      SORT_KEY      = "DAY#YYYY-MM-DD#<group_by>"     (`-` when not grouped)
+      summary       = zlib-compressed JSON of the day's summary
+      expires_at    = epoch seconds, SUMMARY_MEMO_TTL_SECONDS after writing
+
+`plan_memoized()` splits a range into the closed whole days, looked up in
+that order, and the partial first / open last day, which are always
+computed live; `fill_days()` computes and stores the misses.  `refresh=True` skips both
+lookups and overwrites the stored days.  Every call prints one CloudWatch
+EMF line with the LRU hits, table hits and misses.
+
+`expires_at` is only honoured by DynamoDB if TTL is enabled on that
+attribute; expired items are also ignored on read.
+
+A transaction written after its day closed is missing from that day's memo
+until `summary_rollup.recheck()` drops it (daily, for the last
+SUMMARY_RECHECK_DAYS days) or `refresh=True` recomputes it.
+"""
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from summary_engine import (
+    SUMMARY_SETTLE_SECONDS, TABLE_NAME, day_of, day_start, merge_summaries, restore_sums, summarize,
+    thread_table,
+)
+
+MEMO_PARTITION_KEY = "SUMMARY_MEMO"
+
+SUMMARY_MEMO_TTL_SECONDS = int(os.environ.get('SUMMARY_MEMO_TTL_SECONDS', 30 * 86400))
+SUMMARY_MEMO_LRU_SIZE = int(os.environ.get('SUMMARY_MEMO_LRU_SIZE', 512))
+# LRU entries are dropped after this long so a rebuild elsewhere is picked up
+MEMO_LRU_SECONDS = 3600
+# Missed days are computed this many at a time, one slice per partition each
+MEMO_FILL_WORKERS = 4
+BATCH_GET_LIMIT = 100
+
+NAMESPACE = os.environ.get('PERF_METRICS_NAMESPACE', 'FraudDashboardApi')
+
+_lru = OrderedDict()
+
+
+def memo_sort_key(day, group_by):
+    return f"DAY#{day}#{','.join(group_by) or '-'}"
+
+
+def encode_summary(summary):
+    # Decimal sums are written as strings so they round-trip exactly
+    return zlib.compress(json.dumps(summary, default=str, separators=(',', ':')).encode())
+
+
+def decode_summary(data):
+    return restore_sums(json.loads(zlib.decompress(bytes(data))))
+
+
+def lru_get(sort_key):
+    entry = _lru.get(sort_key)
+    if entry is None:
+        return None
+    expires, summary = entry
+    if expires < time.time():
+        del _lru[sort_key]
+        return None
+    _lru.move_to_end(sort_key)
+    return summary
+
+
+def lru_put(sort_key, summary):
+    _lru[sort_key] = (time.time() + MEMO_LRU_SECONDS, summary)
+    _lru.move_to_end(sort_key)
+    while len(_lru) > SUMMARY_MEMO_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def read_memos(sort_keys):
+    """`{sort key: summary}` of the unexpired memo items among *sort_keys*"""
+    # The resource's client (de)serialises values like Table calls do
+    client = thread_table().meta.client
+    now = int(time.time())
+    found = {}
+    for index in range(0, len(sort_keys), BATCH_GET_LIMIT):
+        request = {
+            TABLE_NAME: {
+                'Keys': [
+                    {'PARTITION_KEY': MEMO_PARTITION_KEY, 'SORT_KEY': sort_key}
+                    for sort_key in sort_keys[index:index + BATCH_GET_LIMIT]
+                ],
+                'ProjectionExpression': 'SORT_KEY, summary, expires_at',
+            }
+        }
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(TABLE_NAME, []):
+                if int(item['expires_at']) > now:
+                    found[item['SORT_KEY']] = decode_summary(item['summary'].value)
+            request = response.get('UnprocessedKeys')
+    return found
+
+
+def write_memos(summaries):
+    """Persist `{sort key: summary}`"""
+    expires_at = int(time.time()) + SUMMARY_MEMO_TTL_SECONDS
+    with thread_table().batch_writer() as batch:
+        for sort_key, summary in summaries.items():
+            batch.put_item(Item={
+                'PARTITION_KEY': MEMO_PARTITION_KEY,
+                'SORT_KEY': sort_key,
+                'summary': encode_summary(summary),
+                'expires_at': expires_at,
+            })
+
+
+def forget_day(day):
+    """Delete every memo of *day* (all `group_by` variants)"""
+    prefix = f"DAY#{day}#"
+    for sort_key in [key for key in _lru if key.startswith(prefix)]:
+        del _lru[sort_key]
+    query_kwargs = {
+        'KeyConditionExpression': 'PARTITION_KEY = :pk AND begins_with(SORT_KEY, :prefix)',
+        'ExpressionAttributeValues': {':pk': MEMO_PARTITION_KEY, ':prefix': prefix},
+        'ProjectionExpression': 'SORT_KEY',
+    }
+    with thread_table().batch_writer() as batch:
+        while True:
+            response = thread_table().query(**query_kwargs)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'PARTITION_KEY': MEMO_PARTITION_KEY, 'SORT_KEY': item['SORT_KEY']})
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def emit_memo_metrics(lru_hits, table_hits, misses, live_ranges):
+    """Print the memo counters as a CloudWatch Embedded Metric Format line"""
+    metrics = (
+        ('SummaryMemoLruHits', lru_hits),
+        ('SummaryMemoTableHits', table_hits),
+        ('SummaryMemoMisses', misses),
+        ('SummaryLiveRanges', live_ranges),
+    )
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Function']],
+                'Metrics': [{'Name': name, 'Unit': 'Count'} for name, _ in metrics],
+            }],
+        },
+        'Function': 'TransactionSummary',
+    }
+    for name, value in metrics:
+        record[name] = value
+    print(json.dumps(record))
+
+
+def plan_memoized(start_timestamp, end_timestamp, group_by=(), refresh=False):
+    """
+    Split the range for the memo: returns `(memoized day summaries, closed
+    days still to compute, live (lower, upper) ranges)`.
+    """
+    # Closed whole days inside the range: [first, last)
+    first = start_timestamp + -start_timestamp % 86400
+    last = min(end_timestamp + 1, int(time.time()) - SUMMARY_SETTLE_SECONDS)
+    last -= last % 86400
+    days = [day_of(timestamp) for timestamp in range(first, last, 86400)]
+    if not days:
+        emit_memo_metrics(0, 0, 0, 1)
+        return [], [], [(start_timestamp, end_timestamp)]
+
+    sort_keys = {day: memo_sort_key(day, group_by) for day in days}
+    found = {}
+    lru_hits = table_hits = 0
+    if not refresh:
+        for day, sort_key in sort_keys.items():
+            summary = lru_get(sort_key)
+            if summary is not None:
+                found[day] = summary
+                lru_hits += 1
+        pending = [sort_keys[day] for day in days if day not in found]
+        stored = read_memos(pending) if pending else {}
+        for day in days:
+            if day not in found and sort_keys[day] in stored:
+                found[day] = stored[sort_keys[day]]
+                lru_put(sort_keys[day], found[day])
+                table_hits += 1
+
+    missing = [day for day in days if day not in found]
+    live_ranges = [(start_timestamp, first - 1), (last, end_timestamp)]
+    live_ranges = [(lower, upper) for lower, upper in live_ranges if lower <= upper]
+    emit_memo_metrics(lru_hits, table_hits, len(missing), len(live_ranges))
+    return list(found.values()), missing, live_ranges
+
+
+def fill_days(days, group_by=(), deadline=None):
+    """
+    Compute and memoize closed *days*.  Returns `({day: summary}, days not
+    started)`; past *deadline* (`time.monotonic()`) no further day is
+    started, but days in progress are finished.  The first
+    MEMO_FILL_WORKERS days always run, so every call makes progress.
+    """
+    if not days:
+        return {}, []
+
+    def compute(index, day):
+        if index >= MEMO_FILL_WORKERS and deadline is not None and time.monotonic() >= deadline:
+            return None
+        start = day_start(day)
+        return summarize(start, start + 86399, slices=1, group_by=group_by)
+
+    with ThreadPoolExecutor(max_workers=min(MEMO_FILL_WORKERS, len(days))) as pool:
+        results = dict(zip(days, pool.map(compute, range(len(days)), days)))
+    computed = {day: summary for day, summary in results.items() if summary is not None}
+    write_memos({memo_sort_key(day, group_by): summary for day, summary in computed.items()})
+    for day, summary in computed.items():
+        lru_put(memo_sort_key(day, group_by), summary)
+    return computed, [day for day in days if day not in computed]
+
+
+def summarize_memoized(start_timestamp, end_timestamp, group_by=(), refresh=False):
+    """
+    `summarize()` of the range, with every closed whole day served from the
+    memo; only the partial and still-open days are read live.
+    """
+    summaries, missing, live_ranges = plan_memoized(start_timestamp, end_timestamp, group_by, refresh)
+    computed, _ = fill_days(missing, group_by)
+    summaries += computed.values()
+    for lower, upper in live_ranges:
+        summaries.append(summarize(lower, upper, group_by=group_by))
+    return merge_summaries(summaries, group_by)
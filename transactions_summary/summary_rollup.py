@@ -0,0 +1,318 @@
+"""
+Persisted daily rollups for `GET /transaction-summary`.
+
+One item per UTC day holds the count and amount sum of every summary bucket:
+
+    PARTITION_KEY = "SUMMARY_ROLLUP"
+    SORT_KEY      = "SUMMARY#YYYY-MM-DD"
+    <bucket>_count, <bucket>_sum        for blacklist, watchlist, ... normal
+
+and one watermark item records how far each source partition has been
+folded in:
+
+    PARTITION_KEY = "SUMMARY_ROLLUP"
+    SORT_KEY      = "WATERMARK"
+    partitions    = {<source partition>: <last processed SORT_KEY>}
+    covered_from  = epoch of the first day the rollups cover
+
+`SummaryRollupFunction` runs `update_incremental()` every few minutes: for
+each source partition it reads the items after the watermark (up to
+SUMMARY_SETTLE_SECONDS ago, so writes that lag by less than that are not
+skipped) and ADDs them to their day items.  The day updates and the
+watermark move are written in one transaction, conditional on the old
+watermark, so a retried or overlapping run can never count an item twice.
+
+An item written more than SUMMARY_SETTLE_SECONDS after its sort-key
+timestamp lands behind the watermark and is never seen by the updater.
+A daily `recheck()` run rebuilds the last SUMMARY_RECHECK_DAYS closed days
+from the raw partitions and drops their memos when the totals changed, so
+such writes are counted within a day.  Writes later than that still need a
+manual `rebuild`.
+
+Manual invocations:
+
+    {"action": "bootstrap", "start_day": "2025-01-01"}   start covering here
+    {"action": "rebuild", "days": ["2025-07-01"]}         recompute from raw
+    {"action": "recheck"}                                 what the daily run does
+
+The handler sums the day items the watermark fully covers and reads raw
+partitions only for the rest of the range (normally just today); see
+`plan_with_rollups()`.
+"""
+import os
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from summary_engine import (
+    FLAT_PROJECTION, SUMMARY_BUCKETS, SUMMARY_SETTLE_SECONDS, SUMMARY_SOURCES, day_of, day_start,
+    empty_summary, summarize, thread_table, to_decimal, transaction_records,
+)
+from summary_memo import forget_day
+
+ROLLUP_PARTITION_KEY = "SUMMARY_ROLLUP"
+WATERMARK_SORT_KEY = "WATERMARK"
+
+UPDATE_SAFETY_MARGIN_MS = 30000
+
+# DynamoDB allows 100 items per transaction; one is the watermark
+MAX_DAYS_PER_TRANSACTION = 99
+
+# Closed days the daily recheck rebuilds, to count writes behind the watermark
+SUMMARY_RECHECK_DAYS = int(os.environ.get('SUMMARY_RECHECK_DAYS', 2))
+
+
+def day_sort_key(day):
+    return f"SUMMARY#{day}"
+
+
+def sort_key_timestamp(sort_key):
+    return int(sort_key.split('_', 1)[0])
+
+
+def read_watermark(table):
+    """`(partitions, covered_from)`; `(None, None)` before the first bootstrap"""
+    item = table.get_item(
+        Key={'PARTITION_KEY': ROLLUP_PARTITION_KEY, 'SORT_KEY': WATERMARK_SORT_KEY}
+    ).get('Item')
+    if not item:
+        return None, None
+    return item['partitions'], int(item['covered_from'])
+
+
+def covered_until(partitions):
+    """Last epoch second every source partition has been fully folded in up to"""
+    def complete(sort_key):
+        # "<ts>_z" covers the whole second; "<ts>_<uuid>" may have siblings left
+        timestamp = sort_key_timestamp(sort_key)
+        return timestamp if sort_key.endswith('_z') else timestamp - 1
+
+    return min(complete(partitions[partition_key]) for partition_key, _, _ in SUMMARY_SOURCES)
+
+
+def read_rollups(table, first_day, last_day):
+    """Sum the day items between the two days (inclusive) into a summary dict"""
+    summary = empty_summary()
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(ROLLUP_PARTITION_KEY) &
+                                Key('SORT_KEY').between(day_sort_key(first_day), day_sort_key(last_day)),
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response.get('Items', []):
+            for bucket in SUMMARY_BUCKETS:
+                summary[bucket]['count'] += int(item.get(f"{bucket}_count", 0))
+                summary[bucket]['sum'] += item.get(f"{bucket}_sum", Decimal(0))
+        if 'LastEvaluatedKey' not in response:
+            return summary
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def plan_with_rollups(start_timestamp, end_timestamp):
+    """
+    `(summary of the whole days the rollups cover or None, [(lower, upper)]
+    ranges left to read elsewhere)`
+    """
+    partitions, covered_from = read_watermark(thread_table())
+    if partitions is None:
+        return None, [(start_timestamp, end_timestamp)]
+
+    # Whole days inside both the request and the rolled-up span
+    first = max(start_timestamp, covered_from)
+    first += -first % 86400
+    last = min(end_timestamp, covered_until(partitions)) + 1
+    last -= last % 86400
+    if last <= first:
+        return None, [(start_timestamp, end_timestamp)]
+
+    summary = read_rollups(thread_table(), day_of(first), day_of(last - 1))
+    raw_ranges = [(start_timestamp, first - 1), (last, end_timestamp)]
+    raw_ranges = [(lower, upper) for lower, upper in raw_ranges if lower <= upper]
+    print(f"Summary from rollups {day_of(first)}..{day_of(last - 1)}, raw ranges {raw_ranges}")
+    return summary, raw_ranges
+
+
+def transact(updates, partition_key, old_sort_key, new_sort_key):
+    """
+    ADD the per-day deltas of one source partition and move its watermark,
+    atomically.  `updates` is `{day: (count, sum)}`.
+    """
+    _, bucket, _ = next(source for source in SUMMARY_SOURCES if source[0] == partition_key)
+    table = thread_table()
+    items = [
+        {
+            'Update': {
+                'TableName': table.name,
+                'Key': {'PARTITION_KEY': ROLLUP_PARTITION_KEY, 'SORT_KEY': day_sort_key(day)},
+                'UpdateExpression': 'ADD #count :count, #sum :sum',
+                'ExpressionAttributeNames': {'#count': f"{bucket}_count", '#sum': f"{bucket}_sum"},
+                'ExpressionAttributeValues': {':count': count, ':sum': total},
+            }
+        }
+        for day, (count, total) in updates.items()
+    ]
+    items.append({
+        'Update': {
+            'TableName': table.name,
+            'Key': {'PARTITION_KEY': ROLLUP_PARTITION_KEY, 'SORT_KEY': WATERMARK_SORT_KEY},
+            'UpdateExpression': 'SET #partitions.#source = :new',
+            'ConditionExpression': '#partitions.#source = :old',
+            'ExpressionAttributeNames': {'#partitions': 'partitions', '#source': partition_key},
+            'ExpressionAttributeValues': {':new': new_sort_key, ':old': old_sort_key},
+        }
+    })
+    # The resource's client takes plain Python values, like Table calls do
+    table.meta.client.transact_write_items(TransactItems=items)
+
+
+def update_partition(partition_key, watermark, upper_timestamp, context=None):
+    """Fold the items after *watermark* into the day items; returns the new watermark"""
+    normal_only = next(source[2] for source in SUMMARY_SOURCES if source[0] == partition_key)
+    upper_sort_key = f"{upper_timestamp}_z"
+    if watermark >= upper_sort_key:
+        return watermark
+
+    query_kwargs = {
+        'KeyConditionExpression': Key('PARTITION_KEY').eq(partition_key) &
+                                Key('SORT_KEY').between(watermark, upper_sort_key),
+        **FLAT_PROJECTION,
+    }
+    while True:
+        response = thread_table().query(**query_kwargs)
+        updates = {}
+        last_sort_key = watermark
+        for sort_key, transaction, has_evaluation in transaction_records(response.get('Items', [])):
+            if sort_key <= watermark:
+                continue
+            day = day_of(sort_key_timestamp(sort_key))
+            if day not in updates and len(updates) == MAX_DAYS_PER_TRANSACTION:
+                transact(updates, partition_key, watermark, last_sort_key)
+                watermark, updates = last_sort_key, {}
+            last_sort_key = sort_key
+            if normal_only and has_evaluation:
+                continue
+            amount = to_decimal(transaction['amount'])
+            count, total = updates.get(day, (0, Decimal(0)))
+            updates[day] = (count + 1, total + amount)
+
+        done = 'LastEvaluatedKey' not in response
+        new_watermark = upper_sort_key if done else last_sort_key
+        if new_watermark != watermark:
+            transact(updates, partition_key, watermark, new_watermark)
+            watermark = new_watermark
+        if done:
+            return watermark
+        if context and context.get_remaining_time_in_millis() < UPDATE_SAFETY_MARGIN_MS:
+            return watermark
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def update_incremental(context=None):
+    """Advance every source partition's watermark to SUMMARY_SETTLE_SECONDS ago"""
+    partitions, _ = read_watermark(thread_table())
+    if partitions is None:
+        print("Summary rollups not bootstrapped; nothing to update")
+        return {}
+    upper_timestamp = int(time.time()) - SUMMARY_SETTLE_SECONDS
+    return {
+        partition_key: update_partition(partition_key, partitions[partition_key], upper_timestamp, context)
+        for partition_key, _, _ in SUMMARY_SOURCES
+    }
+
+
+def bootstrap(start_day):
+    """
+    Start covering from *start_day*: the updater then catches up from there.
+    Refuses to overwrite an existing watermark, which would re-add its days.
+    """
+    start_sort_key = f"{day_start(start_day) - 1}_z"
+    thread_table().put_item(
+        Item={
+            'PARTITION_KEY': ROLLUP_PARTITION_KEY,
+            'SORT_KEY': WATERMARK_SORT_KEY,
+            'partitions': {partition_key: start_sort_key for partition_key, _, _ in SUMMARY_SOURCES},
+            'covered_from': day_start(start_day),
+        },
+        ConditionExpression='attribute_not_exists(PARTITION_KEY)'
+    )
+
+
+def rebuild_day(day, force=True):
+    """
+    Recompute one day item from the raw partitions.  Only days the watermark
+    has fully passed can be rebuilt; a later day would be double counted by
+    the next incremental update.  Without *force*, a day whose totals did not
+    change is left alone and None is returned.
+    """
+    partitions, covered_from = read_watermark(thread_table())
+    start = day_start(day)
+    end = start + 86399
+    if partitions is None or start < covered_from or end > covered_until(partitions):
+        raise ValueError(f"{day} is not covered by the rollup watermark")
+
+    summary = summarize(start, end)
+    item = {'PARTITION_KEY': ROLLUP_PARTITION_KEY, 'SORT_KEY': day_sort_key(day)}
+    for bucket, totals in summary.items():
+        item[f"{bucket}_count"] = totals['count']
+        item[f"{bucket}_sum"] = totals['sum']
+    if not force:
+        stored = thread_table().get_item(
+            Key={'PARTITION_KEY': ROLLUP_PARTITION_KEY, 'SORT_KEY': day_sort_key(day)}
+        ).get('Item') or {}
+        totals = {name: value for name, value in item.items() if name not in ('PARTITION_KEY', 'SORT_KEY')}
+        if all(stored.get(name, 0) == value for name, value in totals.items()):
+            return None
+    thread_table().put_item(Item=item)
+    # Grouped summaries of the day may be memoized with the old totals
+    forget_day(day)
+    return summary
+
+
+def recheck(days=SUMMARY_RECHECK_DAYS):
+    """
+    Catch up on late writes: rebuild the last *days* closed days the
+    watermark covers when their totals changed, and drop the memos of closed
+    days it does not cover (they are memoized from the raw partitions).
+    Returns the days that were rebuilt or forgotten.
+    """
+    partitions, covered_from = read_watermark(thread_table())
+    closed_until = int(time.time()) - SUMMARY_SETTLE_SECONDS + 1
+    closed_until -= closed_until % 86400
+    changed = []
+    for index in range(days, 0, -1):
+        start = closed_until - index * 86400
+        day = day_of(start)
+        if partitions is not None and start >= covered_from and start + 86399 <= covered_until(partitions):
+            if rebuild_day(day, force=False) is not None:
+                changed.append(day)
+        else:
+            forget_day(day)
+            changed.append(day)
+    print(f"Summary recheck of the last {days} closed days changed {changed}")
+    return changed
+
+
+def lambda_handler(event, context):
+    event = event or {}
+    action = event.get('action', 'update')
+    try:
+        if action == 'bootstrap':
+            bootstrap(event['start_day'])
+            return {'bootstrapped_from': event['start_day']}
+        if action == 'recheck':
+            return {'changed_days': recheck()}
+        if action == 'rebuild':
+            # Sums are Decimal, which the Lambda runtime cannot serialise
+            return {
+                day: {bucket: dict(totals, sum=str(totals['sum'])) for bucket, totals in rebuild_day(day).items()}
+                for day in event['days']
+            }
+        return {'watermarks': update_incremental(context)}
+    except ClientError as e:
+        # Another run moved the watermark first (or it already exists)
+        if e.response['Error']['Code'] not in ('TransactionCanceledException', 'ConditionalCheckFailedException'):
+            raise
+        print(f"Summary rollup {action} stopped: {str(e)}")
+        return {'error': str(e)}
@@ -0,0 +1,105 @@
+"""
+Approximate `GET /transaction-summary` (`mode=approx`).
+
+The range is cut into SUMMARY_SAMPLE_WINDOW_SECONDS windows, the windows
+into equal contiguous strata, and two windows are drawn from every stratum.
+Every source partition is read only inside the drawn windows, and each
+bucket's count and sum are extrapolated with the stratified estimator
+
+    total = sum_h  N_h * mean_h
+    var   = sum_h  N_h^2 * (1 - n_h / N_h) * s_h^2 / n_h
+
+(N_h windows in stratum h, n_h drawn, s_h^2 their sample variance).  The
+reported error is the 95% confidence half-width.  The read cost depends on
+the number of windows drawn, not on the length of the range; a range with
+no more windows than the sample is read in full and is exact.
+
+Draws are seeded with the range, so repeating a request gives the same
+estimate.
+"""
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from summary_engine import MAX_WORKERS, SUMMARY_BUCKETS, SUMMARY_SOURCES, summarize_slice
+
+SUMMARY_SAMPLE_WINDOW_SECONDS = int(os.environ.get('SUMMARY_SAMPLE_WINDOW_SECONDS', 900))
+DEFAULT_SAMPLE_WINDOWS = int(os.environ.get('SUMMARY_SAMPLE_WINDOWS', 64))
+MAX_SAMPLE_WINDOWS = 1000
+WINDOWS_PER_STRATUM = 2
+Z_95 = 1.96
+
+
+def plan_sample(start_timestamp, end_timestamp, windows):
+    """`[(stratum size, [(lower, upper) drawn windows])]` covering the range"""
+    span = end_timestamp - start_timestamp + 1
+    total = -(-span // SUMMARY_SAMPLE_WINDOW_SECONDS)
+
+    def window(index):
+        lower = start_timestamp + index * SUMMARY_SAMPLE_WINDOW_SECONDS
+        return lower, min(lower + SUMMARY_SAMPLE_WINDOW_SECONDS - 1, end_timestamp)
+
+    if total <= windows:
+        return [(total, [window(index) for index in range(total)])]
+
+    rng = random.Random(f"{start_timestamp}:{end_timestamp}:{windows}")
+    strata_count = max(1, windows // WINDOWS_PER_STRATUM)
+    strata = []
+    for h in range(strata_count):
+        first = h * total // strata_count
+        last = (h + 1) * total // strata_count
+        drawn = rng.sample(range(first, last), min(WINDOWS_PER_STRATUM, last - first))
+        strata.append((last - first, [window(index) for index in sorted(drawn)]))
+    return strata
+
+
+def estimate(start_timestamp, end_timestamp, windows=DEFAULT_SAMPLE_WINDOWS):
+    """Return `(data, metadata)`: extrapolated count and sum per bucket with 95% errors"""
+    strata = plan_sample(start_timestamp, end_timestamp, windows)
+    tasks = [
+        (h, [partition_key, f"{lower}_", f"{upper}_z", None])
+        for h, (_, drawn) in enumerate(strata)
+        for lower, upper in drawn
+        for partition_key, _, _ in SUMMARY_SOURCES
+    ]
+    # {(stratum, window lower sort key, bucket): (count, sum)}
+    observed = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(tasks))) as pool:
+        results = pool.map(lambda task: summarize_slice(task[1]), tasks)
+        for (h, task), (bucket, count, total, _, _, _) in zip(tasks, results):
+            observed[(h, task[1], bucket)] = (count, float(total))
+
+    data = {}
+    for bucket in SUMMARY_BUCKETS:
+        totals = {'count': 0.0, 'sum': 0.0}
+        variances = {'count': 0.0, 'sum': 0.0}
+        for h, (size, drawn) in enumerate(strata):
+            values = [observed[(h, f"{lower}_", bucket)] for lower, _ in drawn]
+            n = len(values)
+            for index, name in enumerate(('count', 'sum')):
+                column = [value[index] for value in values]
+                mean = sum(column) / n
+                totals[name] += size * mean
+                if 1 < n < size:
+                    variance = sum((value - mean) ** 2 for value in column) / (n - 1)
+                    variances[name] += size * size * (1 - n / size) * variance / n
+        data[bucket] = {
+            'count': round(totals['count']),
+            'sum': round(totals['sum'], 2),
+            'count_error': round(Z_95 * math.sqrt(variances['count']), 2),
+            'sum_error': round(Z_95 * math.sqrt(variances['sum']), 2),
+        }
+
+    windows_total = sum(size for size, _ in strata)
+    windows_read = sum(len(drawn) for _, drawn in strata)
+    metadata = {
+        'mode': 'approx',
+        'confidence': 0.95,
+        'window_seconds': SUMMARY_SAMPLE_WINDOW_SECONDS,
+        'windows_read': windows_read,
+        'windows_total': windows_total,
+        'sampling_fraction': round(windows_read / windows_total, 6),
+        'exact': windows_read == windows_total,
+    }
+    return data, metadata